@@ -0,0 +1,130 @@
+# airports.py
+# Offline nearest-airport lookup for flights OpenSky couldn't attribute to an airport
+# OpenSky often leaves estDepartureAirport / estArrivalAirport empty for small GA flights;
+# the first and last recorded positions of a flight are usually on or right above the field,
+# so the nearest airport to them is a good estimate.
+# The bundled data/airports.csv is a curated subset of airports around the club's area in
+# OurAirports format (ident,type,name,latitude_deg,longitude_deg). Point AIRPORTS_CSV at the
+# full OurAirports airports.csv for wider coverage - extra columns are ignored.
+# Airports are indexed in a KD-tree over 3D unit vectors, so lookups are O(log n) and
+# don't have to special-case longitude wrap-around.
+import csv
+import math
+import os
+import threading
+import logging
+
+AIRPORTS_CSV = os.environ.get('AIRPORTS_CSV', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'airports.csv'))
+
+# OurAirports types that aren't places a club aircraft takes off from or lands at
+EXCLUDED_TYPES = {'closed', 'heliport', 'seaplane_base', 'balloonport'}
+
+# A position further than this from every airport is not attributed to one (km)
+MAX_AIRPORT_DISTANCE_KM = 10.0
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _unit_vector(lat, lon):
+    phi, lam = math.radians(lat), math.radians(lon)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+
+def _chord_to_km(chord):
+    """Straight-line distance between unit vectors -> great-circle distance in km"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class AirportIndex:
+    """KD-tree of airports, built once from a list of dicts with ident/name/latitude/longitude"""
+
+    def __init__(self, airports):
+        self.airports = airports
+        points = [(_unit_vector(a['latitude'], a['longitude']), i) for i, a in enumerate(airports)]
+        self._root = self._build(points, 0)
+
+    def _build(self, points, depth):
+        # Node: (point, airport index, split axis, left, right)
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        middle = len(points) // 2
+        point, index = points[middle]
+        return (point, index, axis,
+                self._build(points[:middle], depth + 1),
+                self._build(points[middle + 1:], depth + 1))
+
+    def __len__(self):
+        return len(self.airports)
+
+    def nearest(self, lat, lon, max_distance_km=MAX_AIRPORT_DISTANCE_KM):
+        """Return (airport, distance_km) for the closest airport, or (None, None) if none is within range"""
+        if lat is None or lon is None or self._root is None:
+            return None, None
+        target = _unit_vector(lat, lon)
+        best = [None, float('inf')]  # [airport index, squared chord]
+
+        def search(node):
+            if node is None:
+                return
+            point, index, axis, left, right = node
+            d2 = sum((a - b) ** 2 for a, b in zip(point, target))
+            if d2 < best[1]:
+                best[0], best[1] = index, d2
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            search(near)
+            if diff * diff < best[1]:  # The other side could still hold something closer
+                search(far)
+
+        search(self._root)
+        if best[0] is None:
+            return None, None
+        distance = _chord_to_km(math.sqrt(best[1]))
+        if distance > max_distance_km:
+            return None, None
+        return self.airports[best[0]], distance
+
+    def nearest_code(self, lat, lon, max_distance_km=MAX_AIRPORT_DISTANCE_KM):
+        """Identifier of the nearest airport (e.g. 'KDPA'), or None"""
+        airport, _ = self.nearest(lat, lon, max_distance_km)
+        return airport['ident'] if airport else None
+
+
+def load_airports(path=AIRPORTS_CSV):
+    """Read an OurAirports-format CSV into airport dicts"""
+    airports = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row.get('type') in EXCLUDED_TYPES:
+                continue
+            try:
+                airports.append({
+                    'ident': row['ident'],
+                    'name': row.get('name', ''),
+                    'latitude': float(row['latitude_deg']),
+                    'longitude': float(row['longitude_deg'])
+                })
+            except (KeyError, ValueError):
+                continue
+    return airports
+
+
+# Shared index - built on first lookup
+_index = None
+_index_lock = threading.Lock()
+
+def get_airport_index():
+    """Return the shared AirportIndex, loading the dataset on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = AirportIndex(load_airports())
+                    logging.info(f"Loaded {len(_index)} airports from {AIRPORTS_CSV}")
+                except OSError as e:
+                    logging.warning(f"Airport data unavailable ({e}) - flights won't be matched to airports")
+                    _index = AirportIndex([])
+    return _index
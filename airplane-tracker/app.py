@@ -8,61 +8,165 @@
 # source venv/bin/activate
 # pip install -r requirements.txt
 # cd airplane-tracker 
-# python app.py
+# python app.py            -> start the server (no network calls or database work at startup)
+# python app.py selftest   -> run the OpenSky connectivity self-test instead
+# flask --app app selftest -> same self-test through the Flask CLI
 import os
+import sys
+import json
+import hmac
 import threading 
-from flask import Flask, render_template, jsonify, request   # Import Flask modules for server, templates, and JSON
+import click                                       # Flask's CLI library, used for the selftest command
+from flask import Flask, Blueprint, render_template, jsonify, request, g, Response, stream_with_context   # Import Flask modules for server, templates, and JSON
 from flask_cors import CORS                        # Lets the frontend fetch data
 from fetch_data import (                           # Import functions and data from fetch_data.py
     AIRCRAFT_MAP,             # Dictionary of aircraft registrations to ICAO24 codes
-    get_aircraft_states,      # Function to get current aircraft states
+    get_aircraft_states_with_meta,  # Function to get current aircraft states (+ stale/age info during outages)
+    get_cached_aircraft_states,  # Last good states without calling OpenSky (for predicted positions)
+    breakers,                 # Circuit breakers tracking OpenSky health
     get_comprehensive_aircraft_data,  # Function to get current + flight history
     get_flight_history,       # Function to get flight history for one aircraft
     test_comprehensive_tracking  # Function to run a full test of current + history data
 )
 import time  # To get timestamps
+import metrics  # Prometheus-style instrumentation shared with fetch_data.py and database.py
+import profiling  # Per-request stage spans and the on-demand sampling profiler
+from profiling import span
+from estimator import predict_states, prediction_horizon  # Dead-reckoning between upstream polls
+from scheduler import PollScheduler  # Adaptive poll intervals based on flight activity and credit budget
+import archive  # Parquet cold storage for history older than the live retention window
 
-# Import the database
+# Import the database module (the database itself is opened lazily on first use)
 try:
-    from database import db
+    from database import get_db, decode_cursor
+    from writer import get_status_writer  # Write-behind queue so requests don't wait on SQLite commits
     DATABASE_AVAILABLE = True
 except ImportError:
     print("⚠️  Database module not available - running without database features")
     DATABASE_AVAILABLE = False
 
 
-# Initialize Flask app
+# All routes live on this blueprint; create_app() attaches it to a Flask app
+bp = Blueprint('tracker', __name__)
 
-app = Flask(__name__)  # Create a Flask app instance (starts the web server) 
-CORS(app)              # CORS so frontend JS can call API routes without issues
+# Decides how often OpenSky is actually polled, however often dashboards refresh
+poll_scheduler = PollScheduler(AIRCRAFT_MAP)
 
-# Debug: Print current directory and template path
-print(f"Current working directory: {os.getcwd()}")
-print(f"Template folder path: {app.template_folder}")
-print(f"Templates exist: {os.path.exists('templates')}")
-if os.path.exists('templates'):
-    print(f"Files in templates: {os.listdir('templates')}")
+# Cleanup thread is started once per process, however many apps are created
+_cleanup_thread = None
+_cleanup_lock = threading.Lock()
 
-def background_cleanup():
-    """Background task to clean up old data every hour"""
+# First cleanup runs shortly after startup instead of blocking it
+STARTUP_CLEANUP_DELAY = 60
+
+def background_cleanup(interval=3600):
+    """Background task to clean up old data shortly after startup and then every hour"""
+    time.sleep(STARTUP_CLEANUP_DELAY)
     while True:
-        time.sleep(3600)  # Run every hour
         try:
             if DATABASE_AVAILABLE:
-                deleted_count = db.cleanup_old_data()
+                deleted_count = get_db().cleanup_old_data()
                 print(f"🔄 Database cleanup completed. Removed {deleted_count} old records.")
         except Exception as e:
             print(f"❌ Database cleanup error: {e}")
+        time.sleep(interval)  # Run every hour
+
+def start_background_cleanup():
+    """Start the cleanup thread if it is not already running (it opens the database off the startup path)"""
+    global _cleanup_thread
+    if _cleanup_thread is not None:
+        return  # Already running - this runs before every request, so skip the lock
+    with _cleanup_lock:
+        if DATABASE_AVAILABLE and _cleanup_thread is None:
+            _cleanup_thread = threading.Thread(target=background_cleanup, daemon=True, name='ffc-db-cleanup')
+            _cleanup_thread.start()
+
+
+def create_app(config=None):
+    """
+    App factory. Builds the Flask app without touching the network or the database,
+    so startup stays fast even when OpenSky is unreachable.
+    The cleanup thread starts with the first request, not here - importing app.py builds the
+    module-level app, and that must not spawn threads or open the database.
+    Pass {'START_BACKGROUND_TASKS': False} (or TESTING=True) to skip the cleanup thread.
+    """
+    app = Flask(__name__)  # Create a Flask app instance
+    app.config['START_BACKGROUND_TASKS'] = True
+    if config:
+        app.config.update(config)
+
+    CORS(app)              # CORS so frontend JS can call API routes without issues
+    app.register_blueprint(bp)
+    app.cli.add_command(selftest_command)
+
+    if app.config['START_BACKGROUND_TASKS'] and not app.testing:
+        app.before_request(start_background_cleanup)
+    return app
+
+# Request instrumentation
+
+@bp.before_app_request
+def start_request_timer():
+    """Remember when the request started and begin collecting stage spans"""
+    g.request_started = time.perf_counter()
+    g.trace_token = profiling.start_trace(f"{request.method} {request.full_path.rstrip('?')}")
+
+
+@bp.after_app_request
+def record_request_metrics(response):
+    """Record latency and response size for every request"""
+    started = g.get('request_started')
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    if started is not None:
+        metrics.HTTP_LATENCY.observe(
+            time.perf_counter() - started,
+            endpoint=endpoint, method=request.method, status=response.status_code
+        )
+    if not response.is_streamed:
+        metrics.HTTP_RESPONSE_BYTES.observe(response.calculate_content_length() or 0, endpoint=endpoint)
+    if g.get('trace_token') is not None:
+        # Logs the request if it was slower than SLOW_REQUEST_MS
+        trace = profiling.finish_trace(g.pop('trace_token'))
+        if trace is not None and trace.spans:
+            response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+
+# Flight history pagination: default and maximum rows per page
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def page_args():
+    """Read ?limit=&cursor= for keyset-paginated endpoints"""
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE)), request.args.get('cursor')
+
+def wants_stream():
+    return request.args.get('stream', '0').lower() in ('1', 'true', 'yes')
+
+def stream_flights(flights, header):
+    """
+    Stream a JSON object whose 'flights' array is written one row at a time from a
+    database generator, so large exports never sit fully in memory. 'count' comes last.
+    """
+    def generate():
+        yield json.dumps(header)[:-1] + ', "flights": ['
+        count = 0
+        for flight in flights:
+            yield (', ' if count else '') + json.dumps(flight)
+            count += 1
+        yield f'], "count": {count}}}'
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
-# Start background cleanup thread if database is available
-if DATABASE_AVAILABLE:
-    cleanup_thread = threading.Thread(target=background_cleanup, daemon=True)
-    cleanup_thread.start()
-    print("✅ Database background cleanup started")
+def json_response(payload):
+    """jsonify() wrapper that records how long serialization took"""
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    with span('serialize'), metrics.JSON_SERIALIZE_LATENCY.time(endpoint=endpoint):
+        return jsonify(payload)
 
 # Routes
 
-@app.route("/")
+@bp.route("/")
 def index():
     """
     Homepage route.
@@ -70,10 +174,10 @@ def index():
     """
     #return jsonify({'message': 'FFC Aircraft Tracker API', 'status': 'running'}) -> comment this back in when html is done to replace previous line
     print("Rendering index.html...")
-    return render_template("index.html") 
+    return render_template("index.html", registrations=list(AIRCRAFT_MAP)) 
 
 
-@app.route("/api/live/all")
+@bp.route("/api/live/all")
 def get_all_live_data():
     """
     Calls a function to get current data for all tracked planes.
@@ -83,7 +187,11 @@ def get_all_live_data():
     """
     try:
         icao24_list = list(AIRCRAFT_MAP.values())  # Get list of ICAO24 codes we are tracking
-        states = get_aircraft_states(icao24_list) # Call fetch_data function to get current states
+        # Current states - reused while inside the scheduler's poll interval, last good ones if OpenSky is down
+        states, freshness = get_aircraft_states_with_meta(icao24_list, max_age=poll_scheduler.states_max_age())
+        if not freshness['cached']:
+            poll_scheduler.observe_states(states)
+            poll_scheduler.mark_polled('states')
         
         aircraft_data = []  # Prepare a list to hold aircraft info
         if states:  # Check if any aircraft data was returned
@@ -102,18 +210,24 @@ def get_all_live_data():
                     'last_contact': state[4]  # Timestamp of last contact
                 })
 
-        # Save to database if available
-        if DATABASE_AVAILABLE and aircraft_data:
+        # Queue for the database writer thread (cached data was already saved when it was fresh)
+        if DATABASE_AVAILABLE and aircraft_data and not freshness['cached']:
             try:
-                db.save_aircraft_status(aircraft_data)
+                with span('db_enqueue'):
+                    get_status_writer().submit(aircraft_data)
             except Exception as e:
                 print(f"⚠️  Could not save to database: {e}")
         
         # Return JSON with timestamp, aircraft count, and aircraft data
-        return jsonify({
+        return json_response({
             'timestamp': int(time.time()),  # Current server time
             'aircraft_count': len(aircraft_data),  # Number of tracked aircraft currently transmitting
-            'aircraft': aircraft_data
+            'aircraft': aircraft_data,
+            'stale': freshness['stale'],  # True when OpenSky is unavailable and this is the last good data
+            'cached': freshness['cached'],  # True when reused within the poll interval (or stale)
+            'data_age_seconds': freshness['data_age_seconds'],
+            'upstream': breakers['states'].status(),
+            'next_poll_seconds': poll_scheduler.states_max_age()  # Refreshing sooner just returns cached data
         })
         
     except Exception as e:
@@ -121,7 +235,30 @@ def get_all_live_data():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route("/api/comprehensive/all")
+@bp.route("/api/live/predicted")
+def get_predicted_live_data():
+    """
+    Smoothed positions between upstream polls, safe to call every couple of seconds.
+    Extrapolates the last states we already have along each aircraft's track - it never
+    calls OpenSky. Every aircraft entry carries 'predicted' and 'prediction_seconds'.
+    """
+    try:
+        states, age = get_cached_aircraft_states(AIRCRAFT_MAP.values())
+        # Extrapolate across the whole gap between polls, which the credit budget may stretch past a minute
+        horizon = prediction_horizon(poll_scheduler.states_max_age())
+        aircraft_data = predict_states(states or [], max_horizon=horizon)
+        return json_response({
+            'timestamp': int(time.time()),
+            'aircraft_count': len(aircraft_data),
+            'aircraft': aircraft_data,
+            'predicted': True,
+            'data_age_seconds': int(age) if age is not None else None
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route("/api/comprehensive/all")
 def get_comprehensive_data():
     """
     Return both current state and flight history for all tracked aircraft.
@@ -129,26 +266,32 @@ def get_comprehensive_data():
     Returns everything in JSON
     """
     try:
-        comprehensive_data = get_comprehensive_aircraft_data()  # Get data for all aircraft
+        comprehensive_data = get_comprehensive_aircraft_data(poll_scheduler)  # Get data for all aircraft
 
         # Process and store flight data in database if available
         if DATABASE_AVAILABLE:
             try:
-                process_flight_data(comprehensive_data)
+                with span('db_write'):
+                    process_flight_data(comprehensive_data)
             except Exception as e:
                 print(f"⚠️  Could not process flight data: {e}")
 
         # Return JSON with timestamp and full data
-        return jsonify({
+        return json_response({
             'timestamp': int(time.time()),
-            'data': comprehensive_data
+            'data': comprehensive_data,
+            'stale': any(
+                meta['stale'] for data in comprehensive_data.values() for meta in data.get('freshness', {}).values()
+            ),
+            'upstream': {name: breaker.status() for name, breaker in breakers.items()},
+            'next_poll_seconds': poll_scheduler.states_max_age()
         })
     except Exception as e:
         # Return error if something fails
         return jsonify({'error': str(e)}), 500
 
 
-@app.route("/api/history/<registration>")
+@bp.route("/api/history/<registration>")
 def get_aircraft_history(registration):
     """
     Return flight history for a single aircraft by registration.
@@ -162,7 +305,7 @@ def get_aircraft_history(registration):
         flight_history = get_flight_history(icao24, hours=48)  # Get last 48 hours of flights
         
         # Return JSON with registration, ICAO24, flight history, and number of flights
-        return jsonify({
+        return json_response({
             'registration': registration,
             'icao24': icao24,
             'flight_history': flight_history,
@@ -175,50 +318,71 @@ def get_aircraft_history(registration):
     
 # NEW DATABASE ENDPOINTS
 
-@app.route("/api/database/flights/recent")
+@bp.route("/api/database/flights/recent")
 def get_recent_flights():
-    """Get recent flights from database"""
+    """
+    Get recent flights from database, newest first.
+    Paginated: ?limit=100&cursor=<next_cursor from the previous page>
+    Streaming export of the whole window: ?stream=1
+    """
     if not DATABASE_AVAILABLE:
         return jsonify({'error': 'Database not available'}), 503
         
     try:
         hours = request.args.get('hours', 48, type=int)
-        flights = db.get_recent_flights(hours)
-        return jsonify({
+        limit, cursor = page_args()
+        if wants_stream():
+            # Decode now - a bad cursor must be a 400, not an error halfway through a 200 stream
+            flights = get_db().iter_flights(hours, after=decode_cursor(cursor))
+            return stream_flights(flights, {'timestamp': int(time.time())})
+        with span('db_query'):
+            flights, next_cursor = get_db().get_recent_flights_page(hours, limit, cursor)
+        return json_response({
             'timestamp': int(time.time()),
             'flights': flights,
-            'count': len(flights)
+            'count': len(flights),
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route("/api/database/aircraft/<registration>/history")
+@bp.route("/api/database/aircraft/<registration>/history")
 def get_database_aircraft_history(registration):
-    """Get aircraft flight history from database"""
+    """Get aircraft flight history from database (paginated like /api/database/flights/recent)"""
     if not DATABASE_AVAILABLE:
         return jsonify({'error': 'Database not available'}), 503
         
     try:
         hours = request.args.get('hours', 48, type=int)
-        flights = db.get_aircraft_flight_history(registration, hours)
+        limit, cursor = page_args()
+        if wants_stream():
+            flights = get_db().iter_flights(hours, registration=registration, after=decode_cursor(cursor))
+            return stream_flights(flights, {'registration': registration})
+        with span('db_query'):
+            flights, next_cursor = get_db().get_aircraft_flight_history_page(registration, hours, limit, cursor)
         
         # Get statistics if available
         stats = {}
         try:
-            stats = db.get_aircraft_stats(registration)
+            stats = get_db().get_aircraft_stats(registration)
         except:
             pass  # Stats are optional
         
-        return jsonify({
+        return json_response({
             'registration': registration,
             'flights': flights,
             'stats': stats,
-            'count': len(flights)
+            'count': len(flights),
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route("/api/database/stats")
+@bp.route("/api/database/stats")
 def get_database_stats():
     """Get overall database statistics"""
     if not DATABASE_AVAILABLE:
@@ -226,20 +390,158 @@ def get_database_stats():
         
     try:
         # Get recent flight count from database
-        recent_flights = db.get_recent_flights(hours=48)
+        with span('db_query'):
+            recent_flights_count = get_db().count_recent_flights(hours=48)
         
-        return jsonify({
+        return json_response({
             'timestamp': int(time.time()),
             'total_tracked_aircraft': len(AIRCRAFT_MAP),
-            'recent_flights_count': len(recent_flights),
+            'recent_flights_count': recent_flights_count,
             'database_available': True
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Replay speed limits and the longest real-time pause between two replayed positions
+MIN_REPLAY_SPEED = 0.1
+MAX_REPLAY_SPEED = 100
+MAX_REPLAY_GAP_SECONDS = 5
+
+def sse_event(event, data, event_id=None):
+    """Format one Server-Sent Events message"""
+    message = f"id: {event_id}\n" if event_id is not None else ''
+    return message + f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def parse_event_id(value):
+    """Last-Event-ID header -> the timestamp it carries, or None when missing or malformed"""
+    try:
+        return int(value.strip())
+    except (AttributeError, ValueError):
+        return None
+
+@bp.route("/api/replay/<registration>")
+def replay_aircraft_track(registration):
+    """
+    Stream a recorded track as Server-Sent Events for debriefs.
+    Example: /api/replay/N31401?start=1759300000&end=1759307200&speed=10
+    - speed: playback multiplier (10 = ten times real time)
+    - from: seek to this timestamp instead of starting at `start`
+    Each 'position' event's id is its timestamp, so a reconnecting EventSource resumes
+    where it left off (Last-Event-ID) with an index seek rather than re-reading from the start.
+    """
+    if not DATABASE_AVAILABLE:
+        return jsonify({'error': 'Database not available'}), 503
+    if registration not in AIRCRAFT_MAP:
+        return jsonify({'error': 'Aircraft not in tracking list'}), 404
+
+    end = request.args.get('end', int(time.time()), type=int)
+    start = request.args.get('start', end - 2 * 3600, type=int)
+    speed = max(MIN_REPLAY_SPEED, min(request.args.get('speed', 1.0, type=float), MAX_REPLAY_SPEED))
+    seek = request.args.get('from', type=int)
+    last_event_id = parse_event_id(request.headers.get('Last-Event-ID'))
+    if last_event_id is not None:
+        seek = last_event_id + 1  # Resume after the last position the browser received
+    if seek is not None:
+        start = max(start, seek)
+
+    positions = get_db().iter_status_history(registration, start, end)
+
+    def generate():
+        yield "retry: 3000\n\n"
+        yield sse_event('start', {'registration': registration, 'start': start, 'end': end, 'speed': speed})
+        previous = None
+        for position in positions:
+            if previous is not None:
+                # Sleep the recorded gap scaled by speed; long gaps (aircraft not transmitting) are capped
+                gap = (position['timestamp'] - previous) / speed
+                time.sleep(min(max(gap, 0), MAX_REPLAY_GAP_SECONDS))
+            previous = position['timestamp']
+            yield sse_event('position', position, event_id=position['timestamp'])
+        yield sse_event('end', {'registration': registration})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@bp.route("/api/archive/<table>")
+def get_archived_history(table):
+    """
+    Query archived history older than the 48h live window.
+    Example: /api/archive/status_history?start=1759300000&end=1759400000&registration=N31401&columns=timestamp,latitude,longitude
+    Only the date partitions in [start, end] and the requested columns are read.
+    """
+    if not archive.ARCHIVE_AVAILABLE:
+        return jsonify({'error': 'Archive not available - install pyarrow'}), 503
+    if table not in archive.COLUMNS:
+        return jsonify({'error': f"Unknown archive table: {table}"}), 404
+
+    end = request.args.get('end', int(time.time()), type=int)
+    start = request.args.get('start', end - 7 * 86400, type=int)
+    columns = [c for c in request.args.get('columns', '').split(',') if c] or None
+    try:
+        with span('archive_query'):
+            rows = archive.query_archive(table, start, end, columns, request.args.get('registration')).to_pylist()
+        return json_response({
+            'table': table,
+            'start': start,
+            'end': end,
+            'rows': rows,
+            'count': len(rows)
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route("/api/scheduler/plan")
+def get_scheduler_plan():
+    """Current polling plan: per-aircraft activity, poll intervals and credit budget"""
+    return json_response(poll_scheduler.plan())
+
+@bp.route("/metrics")
+def get_metrics():
+    """Expose upstream, database and request metrics in Prometheus text format"""
+    return Response(metrics.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+# Clients allowed to use admin routes when no ADMIN_TOKEN is configured
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+def admin_authorized():
+    """
+    Admin routes need the X-Admin-Token header when ADMIN_TOKEN is set.
+    Without a token they are only served to requests from this machine.
+    """
+    expected = os.environ.get('ADMIN_TOKEN')
+    if not expected:
+        return request.remote_addr in LOCAL_ADDRESSES
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), expected)
+
+@bp.route("/admin/profile", methods=["GET", "POST", "DELETE"])
+def admin_profile():
+    """
+    Toggle the sampling profiler without restarting the server.
+    POST /admin/profile?seconds=30 starts a profile, DELETE stops it early, GET shows status.
+    Output is written to PROFILE_DIR in folded-stack format (flamegraph.pl / speedscope).
+    """
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    if request.method == "POST":
+        seconds = request.args.get('seconds', 30, type=int)
+        if not profiling.profiler.start(seconds):
+            return jsonify({'error': 'Profiler already running', **profiling.profiler.status()}), 409
+        return jsonify(profiling.profiler.status()), 202
+    if request.method == "DELETE":
+        profiling.profiler.stop()
+    return jsonify(profiling.profiler.status())
+
 def process_flight_data(comprehensive_data):
     """Process flight data and store in database"""
     try:
+        db = get_db()
+        new_flight_ids = []
         for icao24, data in comprehensive_data.items():
             if data.get('flight_history'):
                 for flight in data['flight_history']:
@@ -260,37 +562,57 @@ def process_flight_data(comprehensive_data):
                     }
                     
                     # Save to database
-                    db.save_flight_session(flight_session)
+                    flight_id = db.save_flight_session(flight_session)
+                    if flight_id:
+                        new_flight_ids.append(flight_id)
+        
+        # Attribute new flights OpenSky couldn't place to the airport nearest their first/last position.
+        # Only new ones - a flight that can't be placed now won't be on the next poll either
+        if new_flight_ids:
+            db.fill_missing_airports(flight_ids=new_flight_ids)
     except Exception as e:
         print(f"Error processing flight data: {e}")
 
+# CLI commands
+
+@click.command("selftest")
+def selftest_command():
+    """Check OAuth2 and OpenSky connectivity and print a report for every tracked aircraft"""
+    test_comprehensive_tracking()
+
+
+# App instance used by `flask --app app`, WSGI servers (app:app) and `python app.py`
+app = create_app()
+
 # Main entry point
 
 if __name__ == "__main__":
-    # Run cleanup once at startup if database available
-    if DATABASE_AVAILABLE:
-        try:
-            deleted_count = db.cleanup_old_data()
-            print(f"🗑️  Initial database cleanup removed {deleted_count} old records")
-        except Exception as e:
-            print(f"⚠️  Initial database cleanup failed: {e}")
-    # Optional test?
-    test_comprehensive_tracking()
+    if len(sys.argv) > 1 and sys.argv[1] == "selftest":
+        # Connectivity self-test is explicit now - it makes live network calls and takes a while
+        test_comprehensive_tracking()
+        sys.exit(0)
     
     # Print info about server and endpoints
     print("\nStarting Flask server on http://localhost:5000")
     print("Available endpoints:")
     print("  /api/live/all - Current aircraft data only")
+    print("  /api/live/predicted - Dead-reckoned positions between polls (no upstream calls)")
     print("  /api/comprehensive/all - Current + flight history")
     print("  /api/history/<registration> - Flight history for a specific aircraft")
+    print("  /api/scheduler/plan - Current adaptive polling plan")
+    print("  /metrics - Prometheus metrics (upstream, database and request timings)")
+    print("  /admin/profile - Start (POST ?seconds=N), stop (DELETE) or inspect (GET) the sampling profiler"
+          " (localhost only unless ADMIN_TOKEN is set)")
 
     if DATABASE_AVAILABLE:
         print("  /api/database/flights/recent - Recent flights from database")
         print("  /api/database/aircraft/<registration>/history - Aircraft history from DB")
         print("  /api/database/stats - Database statistics")
+        print("  /api/replay/<registration>?start=&end=&speed= - Replay a recorded track (Server-Sent Events)")
+        print("  /api/archive/<table> - Archived history beyond 48h (needs pyarrow)")
         print("✅ Database features ENABLED")
     else:
         print("⚠️  Database features DISABLED - create database.py to enable")
     
-    # Start Flask development server
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    # Start Flask development server (FLASK_DEBUG=0 skips the reloader for a faster start)
+    app.run(debug=os.environ.get("FLASK_DEBUG", "1") == "1", host="0.0.0.0", port=5000)
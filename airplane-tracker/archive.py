@@ -0,0 +1,328 @@
+# archive.py
+# Cold storage for history older than the 48h live retention window
+# Expiring status_history and flight_sessions rows are written to compressed, columnar
+# Parquet files partitioned by UTC date before cleanup_old_data deletes them (track_blocks
+# are decoded and archived as status_history rows, so the archive looks the same whichever
+# TRACK_STORAGE recorded it):
+#   archive/status_history/date=2025-10-01/part-1759363200.parquet
+# Queries only open the partitions in the requested range and only read the requested
+# columns, using memory-mapped reads.
+import os
+import glob
+import time
+import logging
+import importlib.util
+from datetime import datetime, timedelta, timezone
+
+import tracks
+
+# pyarrow is optional - without it cleanup simply deletes expired rows as before.
+# It is only imported when the archive is first used, so it doesn't slow down startup.
+ARCHIVE_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# Root directory of the archive
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+
+# Compression codec for archive files (zstd gives good ratios on repetitive track data)
+COMPRESSION = 'zstd'
+
+# Rows read from SQLite per batch (keeps memory flat when a large backlog expires at once)
+BATCH_SIZE = 10000
+
+# Track blocks read per batch - each one decodes into up to an hour of points
+BLOCK_BATCH_SIZE = 100
+
+# Column name -> Arrow type name for each archived table. Registration and icao24 are
+# denormalized in so archive files can be read without the live aircraft table.
+COLUMNS = {
+    'status_history': (
+        ('id', 'int64'),
+        ('aircraft_id', 'int64'),
+        ('registration', 'string'),
+        ('icao24', 'string'),
+        ('timestamp', 'int64'),
+        ('latitude', 'float64'),
+        ('longitude', 'float64'),
+        ('altitude', 'float64'),
+        ('velocity', 'float64'),
+        ('heading', 'float64'),
+        ('on_ground', 'bool_'),
+        ('callsign', 'string'),
+    ),
+    'flight_sessions': (
+        ('id', 'int64'),
+        ('aircraft_id', 'int64'),
+        ('registration', 'string'),
+        ('icao24', 'string'),
+        ('callsign', 'string'),
+        ('departure_airport', 'string'),
+        ('arrival_airport', 'string'),
+        ('departure_time', 'int64'),
+        ('arrival_time', 'int64'),
+        ('duration_minutes', 'int64'),
+        ('max_altitude', 'float64'),
+        ('max_speed', 'float64'),
+        ('distance_km', 'float64'),
+        ('first_seen', 'int64'),
+        ('last_seen', 'int64'),
+    ),
+}
+
+# Column each table is partitioned (and range-filtered) on
+PARTITION_COLUMN = {
+    'status_history': 'timestamp',
+    'flight_sessions': 'last_seen'
+}
+
+# SQL that selects the expiring rows of each table, ordered by the partition column
+EXPIRING_SQL = {
+    'status_history': '''
+        SELECT sh.id, sh.aircraft_id, a.registration, a.icao24, sh.timestamp, sh.latitude, sh.longitude,
+               sh.altitude, sh.velocity, sh.heading, sh.on_ground, sh.callsign
+        FROM status_history sh
+        LEFT JOIN aircraft a ON sh.aircraft_id = a.id
+        WHERE sh.timestamp < ?
+        ORDER BY sh.timestamp
+    ''',
+    'flight_sessions': '''
+        SELECT fs.id, fs.aircraft_id, a.registration, a.icao24, fs.callsign, fs.departure_airport,
+               fs.arrival_airport, fs.departure_time, fs.arrival_time, fs.duration_minutes, fs.max_altitude,
+               fs.max_speed, fs.distance_km, fs.first_seen, fs.last_seen
+        FROM flight_sessions fs
+        LEFT JOIN aircraft a ON fs.aircraft_id = a.id
+        WHERE fs.last_seen < ?
+        ORDER BY fs.last_seen
+    ''',
+    'track_blocks': '''
+        SELECT tb.rowid, tb.aircraft_id, a.registration, a.icao24, tb.data
+        FROM track_blocks tb
+        LEFT JOIN aircraft a ON tb.aircraft_id = a.id
+        WHERE tb.block_end < ?
+        ORDER BY tb.block_start
+    '''
+}
+
+
+def _arrow():
+    """(pyarrow, pyarrow.parquet), imported on first use"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    return pa, pq
+
+
+# Arrow schemas, built from COLUMNS on first use
+_schemas = {}
+
+def schema(table):
+    """Arrow schema of an archived table"""
+    if table not in _schemas:
+        pa, _ = _arrow()
+        _schemas[table] = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in COLUMNS[table]])
+    return _schemas[table]
+
+
+def _partition_date(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def _partition_dir(table, date, archive_dir=None):
+    return os.path.join(archive_dir or ARCHIVE_DIR, table, f"date={date}")
+
+
+def _coerce(value, arrow_type):
+    """SQLite is loosely typed - make values fit the archive schema"""
+    pa, _ = _arrow()
+    if value is None:
+        return None
+    if pa.types.is_integer(arrow_type):
+        return int(value)
+    if pa.types.is_floating(arrow_type):
+        return float(value)
+    if pa.types.is_boolean(arrow_type):
+        return bool(value)
+    return str(value)
+
+
+def _to_record_batch(rows, table_schema):
+    pa, _ = _arrow()
+    columns = []
+    for index, field in enumerate(table_schema):
+        columns.append(pa.array([_coerce(row[index], field.type) for row in rows], type=field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=table_schema)
+
+
+def write_partitions(table, batches, archive_dir=None):
+    """
+    Append batches of `table` rows (tuples in COLUMNS order) to date-partitioned Parquet files,
+    one new part file per date touched. Returns the number of rows written; raises if a file
+    could not be written.
+    """
+    _, pq = _arrow()
+    table_schema = schema(table)
+    partition_index = table_schema.get_field_index(PARTITION_COLUMN[table])
+    part_name = f"part-{int(time.time() * 1000)}.parquet"
+    writers = {}
+    written = 0
+    try:
+        for rows in batches:
+            # Group the batch by UTC date of the partition column
+            by_date = {}
+            for row in rows:
+                stamp = row[partition_index]
+                by_date.setdefault(_partition_date(stamp if stamp is not None else 0), []).append(row)
+            for date, date_rows in by_date.items():
+                writer = writers.get(date)
+                if writer is None:
+                    directory = _partition_dir(table, date, archive_dir)
+                    os.makedirs(directory, exist_ok=True)
+                    writer = pq.ParquetWriter(os.path.join(directory, part_name), table_schema, compression=COMPRESSION)
+                    writers[date] = writer
+                writer.write_batch(_to_record_batch(date_rows, table_schema))
+                written += len(date_rows)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    if written:
+        logging.info(f"Archived {written} {table} rows into {len(writers)} partition(s)")
+    return written
+
+
+def archive_expiring_rows(conn, table, cutoff_time, archive_dir=None):
+    """
+    Write rows of `table` older than cutoff_time to date-partitioned Parquet files.
+    Runs as plain reads (no write lock is held while files are written) and returns the ids
+    of the archived rows - the caller deletes exactly those, so rows that expire in the
+    meantime wait for the next cleanup. Raises if a file could not be written, in which
+    case the caller must not delete anything.
+    """
+    id_index = schema(table).get_field_index('id')
+    archived_ids = []
+    cursor = conn.cursor()
+    cursor.execute(EXPIRING_SQL[table], (cutoff_time,))
+
+    def batches():
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                return
+            archived_ids.extend(row[id_index] for row in rows)
+            yield rows
+
+    write_partitions(table, batches(), archive_dir)
+    return archived_ids
+
+
+def archive_expiring_track_blocks(conn, cutoff_time, archive_dir=None):
+    """
+    Decode track_blocks that ended before cutoff_time and write their points to the
+    status_history partitions (id is left empty - block points never had one).
+    Returns the rowids of the archived blocks; raises like archive_expiring_rows.
+    """
+    archived_rowids = []
+    cursor = conn.cursor()
+    cursor.execute(EXPIRING_SQL['track_blocks'], (cutoff_time,))
+
+    def batches():
+        while True:
+            blocks = cursor.fetchmany(BLOCK_BATCH_SIZE)
+            if not blocks:
+                return
+            rows = []
+            for rowid, aircraft_id, registration, icao24, data in blocks:
+                archived_rowids.append(rowid)
+                for point in tracks.decode_points(data):
+                    rows.append((None, aircraft_id, registration, icao24, point['timestamp'], point['latitude'],
+                                 point['longitude'], point['altitude'], point['velocity'], point['heading'],
+                                 point['on_ground'], point['callsign']))
+            yield rows
+
+    write_partitions('status_history', batches(), archive_dir)
+    return archived_rowids
+
+
+def _part_number(path):
+    """part-<milliseconds>.parquet -> milliseconds"""
+    return int(os.path.basename(path)[len('part-'):-len('.parquet')])
+
+
+def _finish_merge(directory):
+    """
+    Complete an interrupted compaction: merging-<n>.parquet holds every row of the parts
+    numbered up to n, so those parts go and the merged file becomes part-<n>. Each step
+    can be repeated safely after a crash.
+    """
+    for leftover in glob.glob(os.path.join(directory, 'merging-*.parquet.tmp')):
+        os.remove(leftover)  # Never finished writing - the parts it was built from are all still there
+    for merged in glob.glob(os.path.join(directory, 'merging-*.parquet')):
+        upto = int(os.path.basename(merged)[len('merging-'):-len('.parquet')])
+        for part in glob.glob(os.path.join(directory, 'part-*.parquet')):
+            if _part_number(part) <= upto:
+                os.remove(part)
+        os.replace(merged, os.path.join(directory, f"part-{upto}.parquet"))
+
+
+def compact_partitions(table, before_date=None, archive_dir=None):
+    """
+    Merge the hourly part files of each finished day into a single file.
+    Days on or after before_date (default: today, UTC) are left alone because they may still grow.
+    The merged file is written under a name queries don't read, the parts it replaces are
+    removed, then it is renamed into place - so a crash never leaves rows in two files.
+    """
+    pa, pq = _arrow()
+    before_date = before_date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    compacted = 0
+    for directory in sorted(glob.glob(os.path.join(archive_dir or ARCHIVE_DIR, table, 'date=*'))):
+        date = os.path.basename(directory)[len('date='):]
+        _finish_merge(directory)
+        parts = sorted(glob.glob(os.path.join(directory, 'part-*.parquet')), key=_part_number)
+        if date >= before_date or len(parts) < 2:
+            continue
+        merged = pa.concat_tables([pq.read_table(part, memory_map=True) for part in parts])
+        merged = merged.sort_by(PARTITION_COLUMN[table])
+        target = os.path.join(directory, f"merging-{_part_number(parts[-1])}.parquet")
+        pq.write_table(merged, target + '.tmp', compression=COMPRESSION)
+        os.replace(target + '.tmp', target)
+        _finish_merge(directory)
+        compacted += 1
+    return compacted
+
+
+def _dates_between(start_time, end_time):
+    day = datetime.fromtimestamp(start_time, tz=timezone.utc).date()
+    last = datetime.fromtimestamp(end_time, tz=timezone.utc).date()
+    while day <= last:
+        yield day.strftime('%Y-%m-%d')
+        day += timedelta(days=1)
+
+
+def query_archive(table, start_time, end_time, columns=None, registration=None, archive_dir=None):
+    """
+    Read archived rows of `table` whose partition column falls in [start_time, end_time].
+    Only partitions for the dates in range are opened and only `columns` are read.
+    Returns a pyarrow.Table (call .to_pylist() for dicts).
+    """
+    if table not in COLUMNS:
+        raise ValueError(f"Unknown archive table: {table}")
+    pa, pq = _arrow()
+    table_schema = schema(table)
+    columns = list(columns) if columns else table_schema.names
+    unknown = [name for name in columns if name not in table_schema.names]
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {', '.join(unknown)}")
+
+    time_column = PARTITION_COLUMN[table]
+    filters = [(time_column, '>=', int(start_time)), (time_column, '<=', int(end_time))]
+    if registration:
+        filters.append(('registration', '=', registration))
+    # Filter columns must be read too; they are dropped again below
+    read_columns = list(dict.fromkeys(columns + [f[0] for f in filters]))
+
+    tables = []
+    for date in _dates_between(start_time, end_time):
+        for part in sorted(glob.glob(os.path.join(_partition_dir(table, date, archive_dir), 'part-*.parquet'))):
+            tables.append(pq.read_table(part, columns=read_columns, filters=filters, memory_map=True))
+
+    if not tables:
+        return table_schema.empty_table().select(columns)
+    return pa.concat_tables(tables).select(columns)
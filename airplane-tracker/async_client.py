@@ -0,0 +1,173 @@
+# async_client.py
+# asyncio transport and background event loop for the OpenSky client in fetch_data.py
+# - Concurrency is bounded by a semaphore, so a burst of dashboards can't flood OpenSky
+# - Requests go through aiohttp when it is installed; without it the blocking requests
+#   session runs on the loop's thread pool, so the client behaves the same either way
+# - run_sync() lets synchronous code (Flask routes, the backfill CLI) run a coroutine on a
+#   shared background loop and wait for it, never longer than the timeout it is given
+import asyncio
+import atexit
+import contextvars
+import functools
+import importlib.util
+import json
+import logging
+import os
+import threading
+
+from profiling import span
+
+# aiohttp is optional, and imported on the first request rather than here - it is slow to import
+ASYNC_AVAILABLE = importlib.util.find_spec('aiohttp') is not None
+
+# Upstream timeouts in seconds: (connect, read)
+UPSTREAM_TIMEOUT = (3.05, float(os.environ.get('OPENSKY_TIMEOUT', 10)))
+
+# Most OpenSky requests in flight at once per transport
+MAX_CONCURRENCY = int(os.environ.get('OPENSKY_MAX_CONCURRENCY', 4))
+
+# Extra seconds run_sync() waits past a call's own deadline before giving up on the loop
+RUN_SYNC_GRACE = 5
+
+
+class UpstreamResponse:
+    """The parts of a response fetch_data's metrics and breaker helpers read (requests-compatible names)"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncTransport:
+    """HTTP for one event loop - create it (or let it be created) inside that loop"""
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, timeout=UPSTREAM_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._session = None
+        self._semaphore = None
+
+    def _ensure_session(self):
+        # Created lazily so they bind to the loop that actually runs the transport
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if not ASYNC_AVAILABLE:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+        elif self._session is None or self._session.closed:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1]))
+        return self._session
+
+    async def request(self, method, url, **kwargs):
+        """Send one request and return an UpstreamResponse once its body has been read"""
+        session = self._ensure_session()
+        async with self._semaphore:
+            with span('upstream_fetch'):
+                if ASYNC_AVAILABLE:
+                    async with session.request(method, url, **kwargs) as response:
+                        return UpstreamResponse(response.status, response.headers, await response.read())
+                # requests blocks, so it runs on the loop's default thread pool
+                send = functools.partial(session.request, method, url, timeout=self.timeout, **kwargs)
+                response = await asyncio.get_running_loop().run_in_executor(None, send)
+                return UpstreamResponse(response.status_code, response.headers, response.content)
+
+    def forget(self):
+        """Drop the session and semaphore without closing them - they belong to another process's loop"""
+        self._session = None
+        self._semaphore = None
+
+    async def close(self):
+        if self._session is None:
+            return
+        if ASYNC_AVAILABLE:
+            if not self._session.closed:
+                await self._session.close()
+        else:
+            self._session.close()
+
+
+# Background loop for synchronous callers, with the transport that runs on it
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+shared_transport = AsyncTransport()
+
+def _get_loop():
+    """Start the background event loop thread on first use"""
+    global _loop, _loop_thread
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                _loop_thread = threading.Thread(target=loop.run_forever, daemon=True, name='ffc-async-client')
+                _loop_thread.start()
+                _loop = loop
+                atexit.register(_close_shared_transport)
+    return _loop
+
+def _close_shared_transport():
+    """Close the shared session's connections when the process exits"""
+    try:
+        asyncio.run_coroutine_threadsafe(shared_transport.close(), _loop).result(timeout=5)
+    except Exception:
+        pass
+
+def _forget_loop():
+    """In a forked child (backfill workers): the loop thread wasn't copied, so start afresh on first use"""
+    global _loop, _loop_thread, _loop_lock
+    _loop = _loop_thread = None
+    _loop_lock = threading.Lock()
+    shared_transport.forget()
+
+os.register_at_fork(after_in_child=_forget_loop)
+
+def run_sync(coroutine, timeout):
+    """
+    Run `coroutine` on the background loop and wait up to `timeout` seconds for its result.
+    If it hasn't finished by then it is cancelled and TimeoutError is raised. The caller's
+    context (its request trace) is carried over so spans recorded by the coroutine still show
+    up in the request's Server-Timing.
+    """
+    loop = _get_loop()
+    if threading.current_thread() is _loop_thread:
+        coroutine.close()
+        raise RuntimeError("run_sync() called from the async client's own loop - await the coroutine instead")
+    context = contextvars.copy_context()
+    done = threading.Event()
+    outcome = {}
+
+    def start():
+        outcome['task'] = loop.create_task(coroutine)
+        outcome['task'].add_done_callback(finish)
+
+    def finish(task):
+        try:
+            outcome['result'] = task.result()
+        except BaseException as e:
+            outcome['error'] = e
+        done.set()
+
+    # The task copies the context current while start() runs, i.e. the caller's
+    loop.call_soon_threadsafe(start, context=context)
+    if not done.wait(timeout):
+        # Callbacks run in order, so start() has created the task by the time this runs
+        loop.call_soon_threadsafe(lambda: outcome['task'].cancel())
+        logging.error(f"Async client call {coroutine.__qualname__} did not finish within {timeout:g}s")
+        raise TimeoutError(f"{coroutine.__qualname__} did not finish within {timeout:g}s")
+    if 'error' in outcome:
+        logging.error(f"Async client call {coroutine.__qualname__} failed: {outcome['error']!r}")
+        raise outcome['error']
+    return outcome['result']
@@ -0,0 +1,240 @@
+# backfill.py
+# Rebuild flight_sessions (and their derived columns) for a past period
+# The time range is split into per-aircraft chunks that a process pool fetches from OpenSky
+# and enriches from the recorded positions. The parent process dispatches chunks no faster
+# than the rate limit and stops at the credit budget, writes each chunk's flights with one
+# bulk upsert and checkpoints it in backfill_progress in the same transaction - so running
+# the same command again resumes with the chunks that are still missing.
+# Chunks are aligned to --start and the checkpoint name leaves out --end (which defaults to
+# now), so a later run with a later end also skips what is done and only tops up the last
+# chunk of the previous run.
+# Metrics come from the positions recorded in status_history, or from the Parquet archive for
+# the part older than the live retention window (RETENTION_HOURS). flight_sessions itself only
+# keeps that window too: older backfilled flights are moved to the flight_sessions archive by
+# the next cleanup, or deleted by it when pyarrow isn't installed, and --recompute only sees
+# flights still in the live table.
+#
+#   python backfill.py --start 2025-10-01 --end 2025-10-08
+#   python backfill.py --start 2025-10-01 --end 2025-10-08 --aircraft N31401 --workers 4
+#   python backfill.py --start 2025-10-01 --end 2025-10-08 --recompute   # no OpenSky calls
+import argparse
+import math
+import sys
+import time
+from datetime import datetime, timezone
+from multiprocessing import Pool
+
+import archive
+from fetch_data import AIRCRAFT_MAP, CREDIT_COST, breakers, fetch_flights_between
+from database import RETENTION_HOURS, get_db
+from scheduler import DAILY_CREDIT_BUDGET, STATES_BUDGET_SHARE
+
+DEFAULT_CHUNK_HOURS = 24
+DEFAULT_WORKERS = 4
+# One flight-history request per second
+DEFAULT_RATE_PER_MINUTE = 60
+# Half of the daily flight-history share, so live tracking keeps working during a backfill
+DEFAULT_CREDITS = int(DAILY_CREDIT_BUDGET * (1 - STATES_BUDGET_SHARE)) // 2
+
+EARTH_RADIUS_KM = 6371.0
+
+# Columns derive_flight_metrics needs from archived positions
+POSITION_COLUMNS = ('timestamp', 'latitude', 'longitude', 'altitude', 'velocity')
+
+
+def parse_time(value):
+    """Unix seconds, or a UTC date/time such as 2025-10-01 or 2025-10-01T14:00"""
+    if value.isdigit():
+        return int(value)
+    for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M'):
+        try:
+            return int(datetime.strptime(value, fmt).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"Invalid time: {value}")
+
+
+def split_chunks(start_time, end_time, chunk_seconds):
+    """[(chunk_start, chunk_end), ...] covering start_time..end_time, starting at start_time + n * chunk_seconds"""
+    chunks = []
+    chunk_start = start_time
+    while chunk_start < end_time:
+        chunks.append((chunk_start, min(chunk_start + chunk_seconds, end_time)))
+        chunk_start += chunk_seconds
+    return chunks
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def derive_flight_metrics(positions):
+    """max_altitude / max_speed (as recorded) and distance_km along the track from recorded positions"""
+    altitudes = [p['altitude'] for p in positions if p.get('altitude') is not None]
+    speeds = [p['velocity'] for p in positions if p.get('velocity') is not None]
+    points = [(p['latitude'], p['longitude']) for p in positions
+              if p.get('latitude') is not None and p.get('longitude') is not None]
+    distance = sum(_haversine_km(*a, *b) for a, b in zip(points, points[1:]))
+    return {
+        'max_altitude': round(max(altitudes)) if altitudes else None,
+        'max_speed': round(max(speeds)) if speeds else None,
+        'distance_km': round(distance, 1) if len(points) > 1 else None
+    }
+
+
+def load_positions(db, registration, start_time, end_time):
+    """Recorded positions of one aircraft in time order - live rows plus archived ones older than the retention window"""
+    positions = {p['timestamp']: p for p in db.iter_status_history(registration, start_time, end_time)}
+    retained_from = time.time() - RETENTION_HOURS * 3600
+    if archive.ARCHIVE_AVAILABLE and start_time < retained_from:
+        archived = archive.query_archive('status_history', start_time, end_time, columns=POSITION_COLUMNS,
+                                         registration=registration)
+        for position in archived.to_pylist():
+            positions.setdefault(position['timestamp'], position)
+    return [positions[timestamp] for timestamp in sorted(positions)]
+
+
+def build_session(icao24, flight):
+    """OpenSky /flights/aircraft entry -> flight_sessions row (same mapping as app.process_flight_data)"""
+    return {
+        'icao24': icao24,
+        'callsign': (flight.get('callsign') or '').strip() or None,
+        'departure_airport': flight.get('estDepartureAirport'),
+        'arrival_airport': flight.get('estArrivalAirport'),
+        'departure_time': flight.get('firstSeen'),
+        'arrival_time': flight.get('lastSeen'),
+        'duration_minutes': int(flight.get('lastSeen', 0) - flight.get('firstSeen', 0)) // 60,
+        'first_seen': flight.get('firstSeen'),
+        'last_seen': flight.get('lastSeen')
+    }
+
+
+def run_chunk(task):
+    """
+    Worker: fetch (or, when recomputing, load) one aircraft's flights for one chunk and derive
+    their metrics. Returns (task, sessions, error) - the parent does all the writing.
+    """
+    icao24, registration, chunk_start, chunk_end, fetch = task
+    try:
+        db = get_db()
+        if fetch:
+            if not breakers['flights'].allow_request():
+                return task, None, 'OpenSky unavailable (circuit open)'
+            flights = fetch_flights_between(icao24, chunk_start, chunk_end)
+            # Only a failed request is an error - a chunk the aircraft didn't fly in comes back
+            # as [] (OpenSky answers 404) and is checkpointed as done with 0 flights
+            if flights is None:
+                return task, None, 'flight history request failed'
+            sessions = [build_session(icao24, flight) for flight in flights]
+        else:
+            sessions = db.get_flight_sessions_between(icao24, chunk_start, chunk_end)
+        for session in sessions:
+            if session.get('first_seen') and session.get('last_seen'):
+                positions = load_positions(db, registration, session['first_seen'], session['last_seen'])
+                session.update(derive_flight_metrics(positions))
+        return task, sessions, None
+    except Exception as e:
+        return task, None, str(e)
+
+
+def backfill(start_time, end_time, registrations, chunk_hours=DEFAULT_CHUNK_HOURS, workers=DEFAULT_WORKERS,
+             credits=DEFAULT_CREDITS, rate_per_minute=DEFAULT_RATE_PER_MINUTE, recompute=False, job=None,
+             restart=False):
+    """Run (or resume) a backfill; returns a summary dict"""
+    db = get_db()
+    job = job or f"{'recompute' if recompute else 'fetch'}:{start_time}:{chunk_hours}h"
+    progress = {} if restart else db.get_backfill_progress(job)
+    chunks = split_chunks(start_time, end_time, int(chunk_hours * 3600))
+
+    def is_done(icao24, chunk_start, chunk_end):
+        # A chunk cut short by an earlier run's end only counts once it covers this run's end too
+        status, done_until = progress.get((icao24, chunk_start), (None, None))
+        return status == 'done' and done_until >= chunk_end
+
+    tasks = [
+        (AIRCRAFT_MAP[registration], registration, chunk_start, chunk_end, not recompute)
+        for registration in registrations
+        for chunk_start, chunk_end in chunks
+        if not is_done(AIRCRAFT_MAP[registration], chunk_start, chunk_end)
+    ]
+    summary = {'job': job, 'chunks': len(chunks) * len(registrations), 'already_done': 0,
+               'done': 0, 'failed': 0, 'not_dispatched': 0, 'flights': 0, 'credits_used': 0}
+    summary['already_done'] = summary['chunks'] - len(tasks)
+    print(f"📦 Backfill job '{job}': {len(tasks)} chunk(s) to process, {summary['already_done']} already done")
+    if start_time < time.time() - RETENTION_HOURS * 3600:
+        where = 'moved to the Parquet archive' if archive.ARCHIVE_AVAILABLE else 'deleted (pyarrow not installed)'
+        print(f"⚠️  Flights older than {RETENTION_HOURS}h are {where} by the next database cleanup")
+
+    def handle_result(result):
+        # Runs on the pool's result thread - one chunk at a time, so writes never overlap
+        (icao24, registration, chunk_start, chunk_end, _), sessions, error = result
+        try:
+            if error:
+                db.mark_backfill_chunk(job, icao24, chunk_start, chunk_end, 'failed')
+                summary['failed'] += 1
+                print(f"❌ {registration} {chunk_start}-{chunk_end}: {error}")
+                return
+            written = db.save_flight_sessions_bulk(sessions, checkpoint=(job, icao24, chunk_start, chunk_end))
+            summary['done'] += 1
+            summary['flights'] += written
+            print(f"✅ {registration} {chunk_start}-{chunk_end}: {written} flight(s)")
+        except Exception as e:
+            summary['failed'] += 1
+            print(f"❌ {registration} {chunk_start}-{chunk_end}: could not write results: {e}")
+
+    cost = 0 if recompute else CREDIT_COST['flights']
+    interval = 60.0 / rate_per_minute if cost and rate_per_minute > 0 else 0.0
+    next_dispatch = time.monotonic()
+    with Pool(processes=workers) as pool:
+        for index, task in enumerate(tasks):
+            if summary['credits_used'] + cost > credits:
+                summary['not_dispatched'] = len(tasks) - index
+                print(f"⏸️  Credit budget of {credits} reached - {summary['not_dispatched']} chunk(s) left for the next run")
+                break
+            # The parent paces dispatch, so the pool never outruns the rate limit however many workers there are
+            wait = next_dispatch - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            next_dispatch = max(next_dispatch, time.monotonic()) + interval
+            summary['credits_used'] += cost
+            pool.apply_async(run_chunk, (task,), callback=handle_result)
+        pool.close()
+        pool.join()
+
+    # Flights OpenSky couldn't place get the nearest airport to their recorded endpoints
+    hours = math.ceil((time.time() - start_time) / 3600)
+    summary['airports_filled'] = db.fill_missing_airports(hours=hours)
+    print(f"📊 {summary['done']} chunk(s) written ({summary['flights']} flights), {summary['failed']} failed, "
+          f"{summary['credits_used']} credit(s) used, {summary['airports_filled']} airport(s) filled in")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill or recompute flight_sessions for a past period")
+    parser.add_argument('--start', required=True, type=parse_time, help="Start (UTC date/time or unix seconds)")
+    parser.add_argument('--end', type=parse_time, default=int(time.time()), help="End (default: now)")
+    parser.add_argument('--aircraft', nargs='+', choices=sorted(AIRCRAFT_MAP), default=sorted(AIRCRAFT_MAP),
+                        metavar='REGISTRATION', help="Aircraft to backfill (default: the whole fleet)")
+    parser.add_argument('--chunk-hours', type=float, default=DEFAULT_CHUNK_HOURS, help="Hours per chunk")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Worker processes")
+    parser.add_argument('--credits', type=int, default=DEFAULT_CREDITS, help="Most OpenSky credits to spend this run")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE_PER_MINUTE, help="Most OpenSky requests per minute")
+    parser.add_argument('--recompute', action='store_true',
+                        help="Only re-derive metrics for stored flights (no OpenSky calls)")
+    parser.add_argument('--job', help="Checkpoint name (default: derived from --start, --chunk-hours and --recompute)")
+    parser.add_argument('--restart', action='store_true', help="Ignore checkpoints and process every chunk again")
+    args = parser.parse_args(argv)
+    if args.end <= args.start:
+        parser.error("--end must be after --start")
+
+    summary = backfill(args.start, args.end, args.aircraft, chunk_hours=args.chunk_hours, workers=args.workers,
+                       credits=args.credits, rate_per_minute=args.rate, recompute=args.recompute, job=args.job,
+                       restart=args.restart)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
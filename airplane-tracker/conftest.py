@@ -0,0 +1,6 @@
+# conftest.py
+# pytest setup - the modules live flat in this directory, which pytest puts on sys.path
+# because this file is here. Run with: python -m pytest tests
+
+# testApp.py is a manual smoke test against a running server, not a pytest module
+collect_ignore = ['testApp.py']
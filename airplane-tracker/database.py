@@ -1,16 +1,63 @@
 # database.py
+import os
 import sqlite3
+import threading
 import time
 from datetime import datetime, timedelta
 import logging
+import base64
 from fetch_data import AIRCRAFT_MAP
+import metrics
+import archive
+import tracks
+import airports
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Change-only status recording: a sample is only stored when it tells us something new.
+# An aircraft that hasn't moved (parked, or a repeated report) is stored once per heartbeat.
+HEARTBEAT_SECONDS = int(os.environ.get('PARKED_HEARTBEAT_SECONDS', 600))
+# On the ground and slower than this (m/s) counts as parked
+PARKED_MAX_SPEED = 1.0
+# Position changes smaller than this (degrees, ~10m) don't count as moving
+MIN_MOVE_DEGREES = 0.0001
+# Fields compared to decide whether a sample changed anything
+SAMPLE_FIELDS = ('latitude', 'longitude', 'altitude', 'velocity', 'heading', 'on_ground', 'callsign')
+
+# 'rows' stores one status_history row per kept sample; 'blocks' stores each aircraft's track
+# as delta-encoded, compressed hourly blocks in track_blocks (see tracks.py)
+TRACK_STORAGE = os.environ.get('TRACK_STORAGE', 'rows')
+
+# Hours of history kept in SQLite; cleanup_old_data archives (or drops) anything older
+RETENTION_HOURS = 48
+
+# Ids per ... WHERE id IN (...) statement (SQLite allows 999 variables on older builds)
+ID_CHUNK = 500
+
+def encode_cursor(departure_time, flight_id):
+    """Opaque pagination cursor for the (departure_time, id) position of the last row on a page"""
+    # Flights without a departure time sort as 0, the same as COALESCE(departure_time, 0) in the query
+    raw = f"{departure_time if departure_time is not None else 0}:{flight_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Turn a cursor from encode_cursor() back into (departure_time, id); None passes through"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        departure_time, flight_id = base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+        departure_time = float(departure_time)
+        return (int(departure_time) if departure_time.is_integer() else departure_time, int(flight_id))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
 class AircraftDatabase:
     def __init__(self, db_path='aircraft_tracker.db'):
         self.db_path = db_path
+        self._last_stored = None  # aircraft_id -> last stored sample, loaded on first save
+        self._last_stored_lock = threading.Lock()
         self.init_database()
     
     def init_database(self):
@@ -70,10 +117,48 @@ class AircraftDatabase:
             )
         ''')
         
+        # Delta-encoded track blocks (TRACK_STORAGE=blocks), keyed by their first point's timestamp.
+        # Each commit adds a chunk to the aircraft's current hour; a finished hour is merged into one block
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS track_blocks (
+                aircraft_id INTEGER NOT NULL,
+                block_start INTEGER NOT NULL,
+                block_end INTEGER NOT NULL,
+                point_count INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (aircraft_id, block_start),
+                FOREIGN KEY (aircraft_id) REFERENCES aircraft (id)
+            )
+        ''')
+        
+        # Checkpoints for backfill.py so an interrupted backfill resumes where it stopped
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS backfill_progress (
+                job TEXT NOT NULL,
+                icao24 TEXT NOT NULL,
+                chunk_start INTEGER NOT NULL,
+                chunk_end INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                flights INTEGER DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job, icao24, chunk_start)
+            )
+        ''')
+        
         # Create indexes for performance
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_flight_sessions_times ON flight_sessions(departure_time, arrival_time)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_status_history_timestamp ON status_history(timestamp)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON flight_sessions(created_at)')
+        # Keyset pagination walks flights newest first by (departure_time, id), NULL times sorting as 0
+        cursor.execute('DROP INDEX IF EXISTS idx_flight_sessions_departure_id')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_flight_sessions_departure_key ON flight_sessions(COALESCE(departure_time, 0), id)')
+        # Track replay seeks straight to one aircraft's positions at a given time
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_status_history_aircraft_time ON status_history(aircraft_id, timestamp)')
+        # One row per flight - lets bulk writes upsert instead of checking for duplicates row by row
+        try:
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_flight_sessions_unique ON flight_sessions(aircraft_id, first_seen, last_seen)')
+        except sqlite3.IntegrityError as e:
+            logging.warning(f"Duplicate flight sessions present, bulk upserts unavailable until they are removed: {e}")
         
         conn.commit()
         conn.close()
@@ -100,65 +185,235 @@ class AircraftDatabase:
         conn.close()
     
     def cleanup_old_data(self):
-        """Remove data older than 48 hours"""
-        conn = sqlite3.connect(self.db_path)
+        """Remove data older than 48 hours, archiving it to Parquet first when pyarrow is installed"""
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
         cursor = conn.cursor()
         
-        cutoff_time = (datetime.now() - timedelta(hours=48)).timestamp()
+        cutoff_time = (datetime.now() - timedelta(hours=RETENTION_HOURS)).timestamp()
         
-        # Delete old status history
-        cursor.execute('DELETE FROM status_history WHERE timestamp < ?', (cutoff_time,))
-        status_deleted = cursor.rowcount
+        # Archive first, outside any transaction - writing Parquet can take longer than the
+        # busy timeout other writers wait for. Only the rows that made it into the archive are
+        # deleted afterwards, by id.
+        archived_ids = {}
+        if archive.ARCHIVE_AVAILABLE:
+            try:
+                for table in ('status_history', 'flight_sessions'):
+                    archived_ids[table] = archive.archive_expiring_rows(conn, table, cutoff_time)
+                archived_ids['track_blocks'] = archive.archive_expiring_track_blocks(conn, cutoff_time)
+            except Exception as e:
+                # Keep the rows so the next cleanup can retry the archive
+                conn.close()
+                logging.error(f"Archiving failed, skipping cleanup: {e}")
+                return 0
         
-        # Delete flight sessions that ended more than 48 hours ago
-        cursor.execute('DELETE FROM flight_sessions WHERE last_seen < ?', (cutoff_time,))
-        flights_deleted = cursor.rowcount
+        cursor.execute('BEGIN IMMEDIATE')
+        if archive.ARCHIVE_AVAILABLE:
+            status_deleted = self._delete_ids(cursor, 'status_history', archived_ids['status_history'])
+            flights_deleted = self._delete_ids(cursor, 'flight_sessions', archived_ids['flight_sessions'])
+            blocks_deleted = self._delete_ids(cursor, 'track_blocks', archived_ids['track_blocks'], 'rowid')
+        else:
+            # Delete old status history
+            cursor.execute('DELETE FROM status_history WHERE timestamp < ?', (cutoff_time,))
+            status_deleted = cursor.rowcount
+            
+            # Delete flight sessions that ended more than 48 hours ago
+            cursor.execute('DELETE FROM flight_sessions WHERE last_seen < ?', (cutoff_time,))
+            flights_deleted = cursor.rowcount
+            
+            # Delete track blocks that ended before the cutoff
+            cursor.execute('DELETE FROM track_blocks WHERE block_end < ?', (cutoff_time,))
+            blocks_deleted = cursor.rowcount
         
-        conn.commit()
+        cursor.execute('COMMIT')
         conn.close()
+        metrics.DB_WRITE_LATENCY.observe(time.perf_counter() - started, operation='cleanup_old_data')
+        
+        # Merge the hourly archive files of finished days into one file per day
+        if archive.ARCHIVE_AVAILABLE:
+            for table in ('status_history', 'flight_sessions'):
+                try:
+                    archive.compact_partitions(table)
+                except Exception as e:
+                    logging.warning(f"Could not compact {table} archive: {e}")
         
-        total_deleted = status_deleted + flights_deleted
+        total_deleted = status_deleted + flights_deleted + blocks_deleted
         logging.info(f"Database cleanup removed {total_deleted} old records")
         return total_deleted
     
+    def _delete_ids(self, cursor, table, ids, column='id'):
+        """Delete rows of `table` by id, in chunks that stay under SQLite's variable limit"""
+        deleted = 0
+        for offset in range(0, len(ids), ID_CHUNK):
+            chunk = ids[offset:offset + ID_CHUNK]
+            cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({','.join('?' * len(chunk))})", chunk)
+            deleted += cursor.rowcount
+        return deleted
+    
+    def _load_last_stored(self, cursor):
+        """Latest stored sample per aircraft, so change detection survives restarts"""
+        last_stored = {}
+        if TRACK_STORAGE == 'blocks':
+            cursor.execute('''
+                SELECT aircraft_id, data FROM track_blocks tb
+                WHERE block_start = (SELECT MAX(block_start) FROM track_blocks WHERE aircraft_id = tb.aircraft_id)
+            ''')
+            for aircraft_id, data in cursor.fetchall():
+                points = tracks.decode_points(data)
+                if points:
+                    last_stored[aircraft_id] = points[-1]
+            return last_stored
+        cursor.execute('''
+            SELECT aircraft_id, timestamp, latitude, longitude, altitude, velocity, heading, on_ground, callsign
+            FROM status_history
+            WHERE id IN (
+                SELECT (SELECT id FROM status_history WHERE aircraft_id = a.id ORDER BY timestamp DESC, id DESC LIMIT 1)
+                FROM aircraft a
+            )
+        ''')
+        for row in cursor.fetchall():
+            last_stored[row[0]] = dict(zip(('timestamp',) + SAMPLE_FIELDS, row[1:]))
+        return last_stored
+    
+    @staticmethod
+    def _skip_reason(last, sample):
+        """Why a sample adds nothing over the last stored one ('duplicate', 'parked', 'unchanged'), or None to keep it"""
+        if last is None:
+            return None
+        if sample['timestamp'] <= last['timestamp']:
+            return 'duplicate'  # last_contact hasn't advanced - same report polled again
+        parked = all(
+            point['on_ground'] and (point['velocity'] or 0) < PARKED_MAX_SPEED for point in (last, sample)
+        ) and all(
+            last[field] is not None and sample[field] is not None and
+            abs(last[field] - sample[field]) < MIN_MOVE_DEGREES for field in ('latitude', 'longitude')
+        )
+        unchanged = all(last[field] == sample[field] for field in SAMPLE_FIELDS)
+        if (parked or unchanged) and sample['timestamp'] - last['timestamp'] < HEARTBEAT_SECONDS:
+            return 'parked' if parked else 'unchanged'
+        return None
+    
     def save_aircraft_status(self, aircraft_data):
-        """Save current aircraft status to history"""
+        """
+        Save current aircraft status to history - all rows in one transaction (the writer thread's group commit).
+        Samples that repeat the last stored one are dropped, and parked aircraft are only
+        stored once per HEARTBEAT_SECONDS. Returns the number of samples stored.
+        """
+        started = time.perf_counter()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        # Look the aircraft IDs up once instead of once per row
+        cursor.execute('SELECT icao24, id FROM aircraft')
+        aircraft_ids = dict(cursor.fetchall())
+        
+        with self._last_stored_lock:
+            if self._last_stored is None:
+                self._last_stored = self._load_last_stored(cursor)
+            last_stored = dict(self._last_stored)
+        
+        samples = []  # (aircraft_id, sample) to store
+        previous = {}  # aircraft_id -> last sample stored before this batch
+        skipped = {}
         for aircraft in aircraft_data:
-            try:
-                # Get aircraft ID
-                cursor.execute('SELECT id FROM aircraft WHERE icao24 = ?', (aircraft['icao24'],))
-                result = cursor.fetchone()
-                
-                if result:
-                    aircraft_id = result[0]
-                    cursor.execute('''
-                        INSERT INTO status_history 
-                        (aircraft_id, timestamp, latitude, longitude, altitude, velocity, heading, on_ground, callsign)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        aircraft_id,
-                        aircraft.get('last_contact', int(time.time())),
-                        aircraft.get('latitude'),
-                        aircraft.get('longitude'),
-                        aircraft.get('altitude'),
-                        aircraft.get('velocity'),
-                        aircraft.get('heading'),
-                        aircraft.get('on_ground', False),
-                        aircraft.get('callsign', '')
-                    ))
-            except Exception as e:
-                logging.warning(f"Could not save status for {aircraft.get('icao24')}: {e}")
+            aircraft_id = aircraft_ids.get(aircraft.get('icao24'))
+            if aircraft_id is None:
+                logging.warning(f"Could not save status for {aircraft.get('icao24')}: unknown aircraft")
+                continue
+            sample = {
+                'timestamp': aircraft.get('last_contact') or int(time.time()),
+                'latitude': aircraft.get('latitude'),
+                'longitude': aircraft.get('longitude'),
+                'altitude': aircraft.get('altitude'),
+                'velocity': aircraft.get('velocity'),
+                'heading': aircraft.get('heading'),
+                'on_ground': bool(aircraft.get('on_ground', False)),
+                'callsign': aircraft.get('callsign', '')
+            }
+            reason = self._skip_reason(last_stored.get(aircraft_id), sample)
+            if reason:
+                skipped[reason] = skipped.get(reason, 0) + 1
+                continue
+            previous.setdefault(aircraft_id, last_stored.get(aircraft_id))
+            last_stored[aircraft_id] = sample
+            samples.append((aircraft_id, sample))
         
-        conn.commit()
-        conn.close()
+        try:
+            if TRACK_STORAGE == 'blocks':
+                self._append_track_blocks(cursor, samples, previous)
+            else:
+                cursor.executemany('''
+                    INSERT INTO status_history 
+                    (aircraft_id, timestamp, latitude, longitude, altitude, velocity, heading, on_ground, callsign)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(aircraft_id,) + tuple(sample[field] for field in ('timestamp',) + SAMPLE_FIELDS)
+                      for aircraft_id, sample in samples])
+            conn.commit()
+        finally:
+            conn.close()
+        
+        # Only remember samples once they are committed
+        with self._last_stored_lock:
+            for aircraft_id, sample in samples:
+                self._last_stored[aircraft_id] = sample
+        metrics.DB_WRITE_LATENCY.observe(time.perf_counter() - started, operation='save_aircraft_status')
+        metrics.DB_ROWS_WRITTEN.inc(len(samples), table='track_blocks' if TRACK_STORAGE == 'blocks' else 'status_history')
+        for reason, count in skipped.items():
+            metrics.DB_SAMPLES_SKIPPED.inc(count, reason=reason)
+        return len(samples)
+    
+    def _append_track_blocks(self, cursor, samples, previous):
+        """
+        Store samples as one new chunk per aircraft and hour within the caller's transaction, so a
+        batch only encodes its own points. Once an aircraft's samples reach a later hour, the
+        chunks of the hours it left are merged into a single block.
+        `previous` maps aircraft_id to its last sample stored before this batch.
+        """
+        by_block = {}
+        for aircraft_id, sample in samples:
+            by_block.setdefault((aircraft_id, tracks.block_start(sample['timestamp'])), []).append(sample)
+        for (aircraft_id, start), points in by_block.items():
+            # Samples reach us in timestamp order (see _skip_reason), so chunk keys never collide
+            cursor.execute('''
+                INSERT INTO track_blocks (aircraft_id, block_start, block_end, point_count, data)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (aircraft_id, points[0]['timestamp'], points[-1]['timestamp'], len(points),
+                  tracks.encode_points(points)))
+        
+        current = {}
+        for aircraft_id, start in by_block:
+            current[aircraft_id] = max(start, current.get(aircraft_id, start))
+        finished = {(aircraft_id, start) for aircraft_id, start in by_block if start < current[aircraft_id]}
+        for aircraft_id, start in current.items():
+            last = previous.get(aircraft_id)
+            if last is not None and tracks.block_start(last['timestamp']) < start:
+                finished.add((aircraft_id, tracks.block_start(last['timestamp'])))
+        for aircraft_id, start in finished:
+            self._merge_track_chunks(cursor, aircraft_id, start)
+    
+    def _merge_track_chunks(self, cursor, aircraft_id, start):
+        """Replace the chunks of one aircraft's finished hour with a single block"""
+        chunks = cursor.execute('''
+            SELECT block_start, data FROM track_blocks
+            WHERE aircraft_id = ? AND block_start >= ? AND block_start < ?
+            ORDER BY block_start
+        ''', (aircraft_id, start, start + tracks.BLOCK_SECONDS)).fetchall()
+        if len(chunks) < 2:
+            return
+        points = [point for _, data in chunks for point in tracks.decode_points(data)]
+        cursor.execute('DELETE FROM track_blocks WHERE aircraft_id = ? AND block_start >= ? AND block_start < ?',
+                       (aircraft_id, start, start + tracks.BLOCK_SECONDS))
+        cursor.execute('''
+            INSERT INTO track_blocks (aircraft_id, block_start, block_end, point_count, data)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (aircraft_id, chunks[0][0], points[-1]['timestamp'], len(points), tracks.encode_points(points)))
     
     def save_flight_session(self, flight_data):
-        """Save a complete flight session"""
+        """Save a complete flight session; returns its id if it was new, None if it was already stored"""
+        started = time.perf_counter()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        flight_id = None
         
         try:
             # Get aircraft ID
@@ -195,63 +450,328 @@ class AircraftDatabase:
                         flight_data.get('first_seen'),
                         flight_data.get('last_seen')
                     ))
+                    flight_id = cursor.lastrowid
+                    metrics.DB_ROWS_WRITTEN.inc(table='flight_sessions')
                 
                 conn.commit()
-                return cursor.lastrowid
+                return flight_id
         except Exception as e:
             logging.error(f"Error saving flight session: {e}")
         finally:
             conn.close()
+            metrics.DB_WRITE_LATENCY.observe(time.perf_counter() - started, operation='save_flight_session')
         
         return None
     
-    def get_recent_flights(self, hours=48):
-        """Get flights from the last specified hours"""
+    def save_flight_sessions_bulk(self, sessions, checkpoint=None):
+        """
+        Upsert many flight sessions in one transaction. An existing flight (same aircraft,
+        first_seen and last_seen) gets its times replaced; callsign, airports and derived
+        columns are only replaced when the new value is known.
+        checkpoint=(job, icao24, chunk_start, chunk_end) marks a backfill chunk done in the
+        same transaction, so a crash never records a chunk whose flights weren't written.
+        """
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            aircraft_ids = dict(conn.execute('SELECT icao24, id FROM aircraft').fetchall())
+            rows = [(
+                aircraft_ids[session['icao24']],
+                session.get('callsign'),
+                session.get('departure_airport'),
+                session.get('arrival_airport'),
+                session.get('departure_time'),
+                session.get('arrival_time'),
+                session.get('duration_minutes'),
+                session.get('max_altitude'),
+                session.get('max_speed'),
+                session.get('distance_km'),
+                session.get('first_seen'),
+                session.get('last_seen')
+            ) for session in sessions if session.get('icao24') in aircraft_ids]
+            conn.executemany('''
+                INSERT INTO flight_sessions
+                (aircraft_id, callsign, departure_airport, arrival_airport,
+                 departure_time, arrival_time, duration_minutes, max_altitude,
+                 max_speed, distance_km, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (aircraft_id, first_seen, last_seen) DO UPDATE SET
+                    callsign = COALESCE(excluded.callsign, callsign),
+                    departure_airport = COALESCE(excluded.departure_airport, departure_airport),
+                    arrival_airport = COALESCE(excluded.arrival_airport, arrival_airport),
+                    departure_time = excluded.departure_time,
+                    arrival_time = excluded.arrival_time,
+                    duration_minutes = excluded.duration_minutes,
+                    max_altitude = COALESCE(excluded.max_altitude, max_altitude),
+                    max_speed = COALESCE(excluded.max_speed, max_speed),
+                    distance_km = COALESCE(excluded.distance_km, distance_km)
+            ''', rows)
+            if checkpoint:
+                self._mark_backfill_chunk(conn, *checkpoint, status='done', flights=len(rows))
+            conn.commit()
+        finally:
+            conn.close()
+        metrics.DB_WRITE_LATENCY.observe(time.perf_counter() - started, operation='save_flight_sessions_bulk')
+        metrics.DB_ROWS_WRITTEN.inc(len(rows), table='flight_sessions')
+        return len(rows)
+    
+    @staticmethod
+    def _mark_backfill_chunk(conn, job, icao24, chunk_start, chunk_end, status, flights=0):
+        conn.execute('''
+            INSERT INTO backfill_progress (job, icao24, chunk_start, chunk_end, status, flights, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (job, icao24, chunk_start) DO UPDATE SET
+                chunk_end = excluded.chunk_end, status = excluded.status,
+                flights = excluded.flights, updated_at = excluded.updated_at
+        ''', (job, icao24, chunk_start, chunk_end, status, flights))
+    
+    def mark_backfill_chunk(self, job, icao24, chunk_start, chunk_end, status, flights=0):
+        """Record the outcome of a backfill chunk that wrote nothing (e.g. 'failed')"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self._mark_backfill_chunk(conn, job, icao24, chunk_start, chunk_end, status, flights)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def get_backfill_progress(self, job):
+        """{(icao24, chunk_start): (status, chunk_end)} for every chunk of a backfill job seen so far"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute('SELECT icao24, chunk_start, status, chunk_end FROM backfill_progress WHERE job = ?',
+                                (job,)).fetchall()
+        finally:
+            conn.close()
+        return {(icao24, chunk_start): (status, chunk_end) for icao24, chunk_start, status, chunk_end in rows}
+    
+    def get_flight_sessions_between(self, icao24, start_time, end_time):
+        """Stored flights of one aircraft that ended between two times (for recomputing derived columns)"""
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
+        try:
+            rows = conn.execute('''
+                SELECT a.icao24, fs.callsign, fs.departure_airport, fs.arrival_airport, fs.departure_time,
+                       fs.arrival_time, fs.duration_minutes, fs.first_seen, fs.last_seen
+                FROM flight_sessions fs
+                JOIN aircraft a ON fs.aircraft_id = a.id
+                WHERE a.icao24 = ? AND fs.last_seen >= ? AND fs.last_seen < ?
+            ''', (icao24, start_time, end_time)).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+    
+    def _track_endpoints(self, conn, aircraft_id, start_time, end_time):
+        """First and last recorded (latitude, longitude) of an aircraft between two times"""
+        if TRACK_STORAGE == 'blocks':
+            first = last = None
+            for point in self._iter_track_blocks(aircraft_id, start_time, end_time):
+                if point['latitude'] is not None and point['longitude'] is not None:
+                    first = first or (point['latitude'], point['longitude'])
+                    last = (point['latitude'], point['longitude'])
+            return first, last
+        endpoints = []
+        for order in ('ASC', 'DESC'):
+            endpoints.append(conn.execute(f'''
+                SELECT latitude, longitude FROM status_history
+                WHERE aircraft_id = ? AND timestamp BETWEEN ? AND ? AND latitude IS NOT NULL AND longitude IS NOT NULL
+                ORDER BY timestamp {order}
+                LIMIT 1
+            ''', (aircraft_id, start_time, end_time)).fetchone())
+        return endpoints[0], endpoints[1]
+    
+    def fill_missing_airports(self, hours=48, flight_ids=None):
+        """
+        Fill in departure/arrival airports OpenSky left empty, using the airport nearest to
+        each flight's first and last recorded position. Returns the number of flights updated.
+        With flight_ids only those flights are looked at (the live poller passes the sessions it
+        just inserted); otherwise every flight of the last `hours` with a missing airport is.
+        """
+        started = time.perf_counter()
+        index = airports.get_airport_index()
+        cutoff_time = (datetime.now() - timedelta(hours=hours)).timestamp()
+        conn = sqlite3.connect(self.db_path)
+        updated = 0
+        try:
+            sql = '''
+                SELECT id, aircraft_id, first_seen, last_seen, departure_airport, arrival_airport
+                FROM flight_sessions
+                WHERE last_seen >= ? AND (departure_airport IS NULL OR departure_airport = ''
+                                          OR arrival_airport IS NULL OR arrival_airport = '')
+            '''
+            if flight_ids is None:
+                flights = conn.execute(sql, (cutoff_time,)).fetchall()
+            else:
+                flights = []
+                for offset in range(0, len(flight_ids), ID_CHUNK):
+                    chunk = list(flight_ids[offset:offset + ID_CHUNK])
+                    flights += conn.execute(f"{sql} AND id IN ({','.join('?' * len(chunk))})",
+                                            [cutoff_time] + chunk).fetchall()
+            for flight_id, aircraft_id, first_seen, last_seen, departure, arrival in flights:
+                first, last = self._track_endpoints(conn, aircraft_id, first_seen, last_seen)
+                new_departure = departure or (index.nearest_code(*first) if first else None)
+                new_arrival = arrival or (index.nearest_code(*last) if last else None)
+                if (new_departure, new_arrival) != (departure, arrival):
+                    conn.execute('UPDATE flight_sessions SET departure_airport = ?, arrival_airport = ? WHERE id = ?',
+                                 (new_departure, new_arrival, flight_id))
+                    updated += 1
+            conn.commit()
+        finally:
+            conn.close()
+        metrics.DB_WRITE_LATENCY.observe(time.perf_counter() - started, operation='fill_missing_airports')
+        return updated
+    
+    def _flights_query(self, cursor, hours, registration=None, after=None, limit=None):
+        """
+        Run the flight sessions query shared by the recent/aircraft history methods.
+        Rows are ordered newest first by (departure_time, id), with a missing departure_time
+        sorting as 0 so those rows still get a place in the order; `after` is a decoded
+        cursor (departure_time, id) and only rows after it are returned (keyset pagination).
+        """
         cutoff_time = (datetime.now() - timedelta(hours=hours)).timestamp()
         
-        cursor.execute('''
+        conditions = ['fs.last_seen >= ?']
+        params = [cutoff_time]
+        if registration is not None:
+            conditions.append('a.registration = ?')
+            params.append(registration)
+        if after is not None:
+            conditions.append('(COALESCE(fs.departure_time, 0), fs.id) < (?, ?)')
+            params.extend(after)
+        
+        sql = f'''
             SELECT 
                 fs.*,
                 a.registration,
                 a.icao24
             FROM flight_sessions fs
             JOIN aircraft a ON fs.aircraft_id = a.id
-            WHERE fs.last_seen >= ?
-            ORDER BY fs.departure_time DESC
-        ''', (cutoff_time,))
+            WHERE {' AND '.join(conditions)}
+            ORDER BY COALESCE(fs.departure_time, 0) DESC, fs.id DESC
+        '''
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        cursor.execute(sql, params)
+    
+    def _flights_page(self, operation, hours, registration=None, after=None, limit=None):
+        """Fetch one page of flights; returns (flights, next_cursor or None)"""
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
         
+        self._flights_query(cursor, hours, registration, after, limit)
         flights = [dict(row) for row in cursor.fetchall()]
         conn.close()
+        metrics.DB_QUERY_LATENCY.observe(time.perf_counter() - started, operation=operation)
         
+        next_cursor = None
+        if limit is not None and len(flights) == limit:
+            last = flights[-1]
+            next_cursor = encode_cursor(last['departure_time'], last['id'])
+        return flights, next_cursor
+    
+    def get_recent_flights(self, hours=48):
+        """Get flights from the last specified hours"""
+        flights, _ = self._flights_page('get_recent_flights', hours)
         return flights
     
+    def get_recent_flights_page(self, hours=48, limit=100, cursor=None):
+        """One page of recent flights plus the cursor for the next page (None on the last page)"""
+        return self._flights_page('get_recent_flights', hours, after=decode_cursor(cursor), limit=limit)
+    
     def get_aircraft_flight_history(self, registration, hours=48):
         """Get flight history for a specific aircraft"""
+        flights, _ = self._flights_page('get_aircraft_flight_history', hours, registration)
+        return flights
+    
+    def get_aircraft_flight_history_page(self, registration, hours=48, limit=100, cursor=None):
+        """One page of an aircraft's flight history plus the cursor for the next page"""
+        return self._flights_page('get_aircraft_flight_history', hours, registration, decode_cursor(cursor), limit)
+    
+    def iter_flights(self, hours=48, registration=None, after=None):
+        """
+        Yield flights one at a time straight from the SQLite cursor, newest first,
+        so exports of any size never sit fully in memory. `after` is an already decoded
+        cursor (see decode_cursor) - generators run lazily, so validate it before streaming.
+        """
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        try:
+            db_cursor = conn.cursor()
+            db_cursor.arraysize = 500
+            self._flights_query(db_cursor, hours, registration, after)
+            while True:
+                rows = db_cursor.fetchmany()
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+    
+    def iter_status_history(self, registration, start_time, end_time, batch_size=200):
+        """
+        Yield one aircraft's recorded positions between start_time and end_time in time order.
+        Each batch is a short index seek past the previous batch's (timestamp, id), so no
+        read transaction stays open during a long replay and memory stays constant.
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        result = conn.execute('SELECT id FROM aircraft WHERE registration = ?', (registration,)).fetchone()
+        conn.close()
+        if not result:
+            return
+        aircraft_id = result[0]
+        if TRACK_STORAGE == 'blocks':
+            yield from self._iter_track_blocks(aircraft_id, start_time, end_time)
+            return
         
+        position = (start_time, -1)  # Seek key: (timestamp, id) of the last row yielded
+        while True:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute('''
+                SELECT id, timestamp, latitude, longitude, altitude, velocity, heading, on_ground, callsign
+                FROM status_history
+                WHERE aircraft_id = ? AND (timestamp, id) > (?, ?) AND timestamp <= ?
+                ORDER BY timestamp, id
+                LIMIT ?
+            ''', (aircraft_id, position[0], position[1], end_time, batch_size)).fetchall()
+            conn.close()
+            
+            for row in rows:
+                yield dict(row)
+            if len(rows) < batch_size:
+                return
+            position = (rows[-1]['timestamp'], rows[-1]['id'])
+    
+    def _iter_track_blocks(self, aircraft_id, start_time, end_time):
+        """iter_status_history for TRACK_STORAGE=blocks - decodes one block at a time"""
+        block = tracks.block_start(start_time) - 1
+        while True:
+            conn = sqlite3.connect(self.db_path)
+            row = conn.execute('''
+                SELECT block_start, data FROM track_blocks
+                WHERE aircraft_id = ? AND block_start > ? AND block_start <= ?
+                ORDER BY block_start
+                LIMIT 1
+            ''', (aircraft_id, block, end_time)).fetchone()
+            conn.close()
+            if row is None:
+                return
+            block = row[0]
+            for point in tracks.decode_points(row[1]):
+                if start_time <= point['timestamp'] <= end_time:
+                    yield point
+    
+    def count_recent_flights(self, hours=48):
+        """Count flights from the last specified hours without loading them"""
+        conn = sqlite3.connect(self.db_path)
         cutoff_time = (datetime.now() - timedelta(hours=hours)).timestamp()
-        
-        cursor.execute('''
-            SELECT 
-                fs.*,
-                a.registration,
-                a.icao24
-            FROM flight_sessions fs
-            JOIN aircraft a ON fs.aircraft_id = a.id
-            WHERE a.registration = ? AND fs.last_seen >= ?
-            ORDER BY fs.departure_time DESC
-        ''', (registration, cutoff_time))
-        
-        flights = [dict(row) for row in cursor.fetchall()]
+        count = conn.execute('SELECT COUNT(*) FROM flight_sessions WHERE last_seen >= ?', (cutoff_time,)).fetchone()[0]
         conn.close()
-        
-        return flights
+        return count
     
     def get_aircraft_stats(self, registration, days=7):
         """Get statistics for a specific aircraft"""
@@ -284,5 +804,15 @@ class AircraftDatabase:
             'total_flight_time_hours': round(total_minutes / 60, 1)
         }
 
-# Database instance
-db = AircraftDatabase()
\ No newline at end of file
+# Database instance - created on first use so importing this module has no side effects
+_db = None
+_db_lock = threading.Lock()
+
+def get_db():
+    """Return the shared AircraftDatabase, creating tables and seeding aircraft on first call"""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = AircraftDatabase(os.environ.get('AIRCRAFT_DB_PATH', 'aircraft_tracker.db'))
+    return _db
@@ -0,0 +1,98 @@
+# estimator.py
+# Dead-reckoning between OpenSky polls
+# Extrapolates every aircraft's last reported position along its track using the
+# heading (true_track), velocity and vertical_rate from the state vector, so the map can
+# move markers smoothly without spending extra API credits.
+# A club fleet is a handful of aircraft, so each state is simply handled in turn.
+import math
+import time
+
+# Mean Earth radius in metres
+EARTH_RADIUS_M = 6371000.0
+
+# Default extrapolation limit - after a minute without data a turn or landing
+# makes the estimate worse than the last known position
+MAX_PREDICTION_SECONDS = 60
+
+# When polls are further apart than that (credit budget), the horizon follows the poll
+# interval so markers keep moving until fresh data arrives - up to this cap
+MAX_PREDICTION_HORIZON = 300
+
+# OpenSky positions are already about this old when a poll returns them
+REPORT_LAG_SECONDS = 15
+
+# Climbs and descents level off - only apply vertical_rate for this long
+MAX_VERTICAL_SECONDS = 30
+
+# OpenSky state vector indexes
+ICAO24, CALLSIGN, TIME_POSITION, LAST_CONTACT = 0, 1, 3, 4
+LONGITUDE, LATITUDE, BARO_ALTITUDE, ON_GROUND = 5, 6, 7, 8
+VELOCITY, TRUE_TRACK, VERTICAL_RATE = 9, 10, 11
+
+
+def prediction_horizon(poll_interval):
+    """Extrapolation limit that covers the gap until the next /states/all poll"""
+    return min(MAX_PREDICTION_HORIZON, max(MAX_PREDICTION_SECONDS, poll_interval + REPORT_LAG_SECONDS))
+
+
+def predict_states(states, at_time=None, max_horizon=MAX_PREDICTION_SECONDS):
+    """
+    Estimate where each aircraft is at `at_time` (default now).
+    Returns one dict per state, shaped like /api/live/all aircraft entries plus:
+      predicted          - True when the position was extrapolated
+      prediction_seconds - how far past the last reported position we extrapolated
+      reported_latitude / reported_longitude - the position OpenSky actually reported
+    Aircraft on the ground, without a position/velocity/track, or whose report is older
+    than max_horizon are returned at their reported position with predicted=False.
+    """
+    at_time = time.time() if at_time is None else at_time
+    return [_predict_state(state, at_time, max_horizon) for state in states or []]
+
+
+def _project(lat, lon, track, distance_m):
+    """Great-circle forward projection of a position along a track"""
+    delta = distance_m / EARTH_RADIUS_M
+    phi1, lambda1, theta = math.radians(lat), math.radians(lon), math.radians(track)
+    sin_phi2 = math.sin(phi1) * math.cos(delta) + math.cos(phi1) * math.sin(delta) * math.cos(theta)
+    phi2 = math.asin(sin_phi2)
+    lambda2 = lambda1 + math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi1),
+                                   math.cos(delta) - math.sin(phi1) * sin_phi2)
+    return math.degrees(phi2), (math.degrees(lambda2) + 540) % 360 - 180
+
+
+def _predict_state(state, at_time, max_horizon):
+    lat, lon, altitude = state[LATITUDE], state[LONGITUDE], state[BARO_ALTITUDE]
+    velocity, track, vertical_rate = state[VELOCITY], state[TRUE_TRACK], state[VERTICAL_RATE]
+    reported_at = state[TIME_POSITION] if state[TIME_POSITION] is not None else state[LAST_CONTACT]
+
+    # Elapsed time since the report; zero where we shouldn't extrapolate
+    elapsed = 0.0
+    if (lat is not None and lon is not None and velocity is not None and track is not None
+            and reported_at is not None and not state[ON_GROUND]):
+        dt = at_time - reported_at
+        if 0 < dt <= max_horizon:
+            elapsed = dt
+
+    predicted_lat, predicted_lon, predicted_alt = lat, lon, altitude
+    if elapsed:
+        predicted_lat, predicted_lon = _project(lat, lon, track, velocity * elapsed)
+        if altitude is not None:
+            vertical_seconds = min(elapsed, MAX_VERTICAL_SECONDS)
+            predicted_alt = max(0.0, altitude + (vertical_rate or 0.0) * vertical_seconds)
+
+    return {
+        'icao24': state[ICAO24],
+        'callsign': state[CALLSIGN].strip() if state[CALLSIGN] else 'N/A',
+        'latitude': predicted_lat,
+        'longitude': predicted_lon,
+        'altitude': predicted_alt,
+        'velocity': velocity,
+        'heading': track,
+        'vertical_rate': vertical_rate,
+        'on_ground': state[ON_GROUND],
+        'last_contact': state[LAST_CONTACT],
+        'predicted': elapsed > 0,
+        'prediction_seconds': round(elapsed, 1),
+        'reported_latitude': lat,
+        'reported_longitude': lon
+    }
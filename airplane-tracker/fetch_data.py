@@ -1,11 +1,18 @@
-from flask import Flask, render_template, jsonify
-from flask_cors import CORS
-import requests
+# fetch_data.py
+# OpenSky Network client for the FFC tracker - the web routes live in app.py
+# Requests run on an asyncio client (OpenSkyClient); the plain functions are synchronous
+# wrappers that run the shared client on async_client's background loop.
+# Run `python fetch_data.py` for the connectivity self-test
+import asyncio
+import os
 import time
 from datetime import datetime, timedelta
-
-app = Flask(__name__)
-CORS(app)
+import metrics
+from profiling import span
+from resilience import CircuitBreaker, LastGoodCache, STALE_SERVED, freshness, retry_after_seconds
+from scheduler import daily_credits
+from sources import get_state_source
+from async_client import AsyncTransport, RUN_SYNC_GRACE, run_sync, shared_transport
 
 # OpenSky Network API endpoints
 OPENSKY_BASE_URL = "https://opensky-network.org/api"
@@ -26,136 +33,379 @@ AIRCRAFT_MAP = {
 access_token = None
 token_expiry = None
 
-def get_oauth_token():
-    """Get OAuth2 access token from OpenSky"""
-    global access_token, token_expiry
-    
-    # Check if we have a valid token
+# Default per-call deadline in seconds - token refresh, queueing for a connection and the request itself
+DEFAULT_DEADLINE = float(os.environ.get('OPENSKY_DEADLINE', 15))
+
+# One circuit breaker per OpenSky endpoint - token failures count against 'flights'
+breakers = {
+    'states': CircuitBreaker('states'),
+    'flights': CircuitBreaker('flights')
+}
+
+# Last successful results, served with their age while OpenSky is unavailable
+last_good = LastGoodCache()
+
+def record_upstream_health(endpoint, response=None, error=None):
+    """Feed a request outcome into the endpoint's circuit breaker"""
+    breaker = breakers[endpoint]
+    if response is None:
+        breaker.record_failure(error)
+    elif response.status_code == 429:
+        retry_after = retry_after_seconds(response)
+        breaker.record_failure('HTTP 429 rate limited', retry_after=retry_after if retry_after is not None else 60)
+    elif response.status_code >= 500:
+        breaker.record_failure(f"HTTP {response.status_code}")
+    else:
+        # Any other answer (including 404 "no flights" and 401/403) proves OpenSky is reachable
+        breaker.record_success()
+
+def serve_cached(cache_key, max_age):
+    """Return (value, freshness) if the last good result is younger than max_age, else (None, None)"""
+    if max_age is None:
+        return None, None
+    value, age = last_good.get(cache_key)
+    if value is None or age >= max_age:
+        return None, None
+    return value, freshness(False, age, cached=True)
+
+def serve_stale(endpoint, cache_key):
+    """Return the last good result for cache_key with freshness metadata marking it stale"""
+    value, age = last_good.get(cache_key)
+    if value is not None:
+        STALE_SERVED.inc(endpoint=endpoint)
+    return value, freshness(True, age)
+# Estimated OpenSky credit cost per request type (a global /states/all query costs 4 credits)
+CREDIT_COST = {
+    'states': 4,
+    'flights': 1
+}
+
+def _record_upstream(endpoint, response, started):
+    """Record latency, payload size and credit usage for an OpenSky response"""
+    elapsed = time.perf_counter() - started
+    metrics.UPSTREAM_LATENCY.observe(elapsed, endpoint=endpoint, status=response.status_code)
+    metrics.UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    metrics.UPSTREAM_BYTES.observe(len(response.content), endpoint=endpoint)
+    used = CREDIT_COST[endpoint] if endpoint in CREDIT_COST and response.status_code == 200 else 0
+    if used:
+        metrics.CREDITS_USED.inc(used, endpoint=endpoint)
+    remaining = response.headers.get('X-Rate-Limit-Remaining')
+    remaining = int(remaining) if remaining is not None and remaining.isdigit() else None
+    if remaining is not None:
+        metrics.CREDITS_REMAINING.set(remaining, endpoint=endpoint)
+    if endpoint in CREDIT_COST:
+        daily_credits.record(endpoint, used, remaining)
+
+def _record_upstream_error(endpoint, started):
+    """Record a request that never got an HTTP response (timeout, DNS, connection reset)"""
+    elapsed = time.perf_counter() - started
+    metrics.UPSTREAM_LATENCY.observe(elapsed, endpoint=endpoint, status='error')
+    metrics.UPSTREAM_REQUESTS.inc(endpoint=endpoint, status='error')
+
+def _cached_token():
+    """The current token if it hasn't expired (counted as a cache hit), else None"""
     if access_token and token_expiry and time.time() < token_expiry:
+        metrics.TOKEN_CACHE.inc(result='hit')
         return access_token
-    
-    try:
-        print("Requesting new OAuth2 token...")
-        response = requests.post(
-            OAUTH_TOKEN_URL,
-            data={
-                'grant_type': 'client_credentials',
-                'client_id': CLIENT_ID,
-                'client_secret': CLIENT_SECRET
-            },
-            headers={'Content-Type': 'application/x-www-form-urlencoded'},
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            token_data = response.json()
-            access_token = token_data['access_token']
+    return None
+
+
+class OpenSkyClient:
+    """
+    asyncio OpenSky client - the one implementation of every upstream call. Async code (an
+    async server, an asyncio ingestion loop) creates one inside its own loop and awaits it;
+    the synchronous functions below run shared_client on the background loop.
+    Every public method returns within its deadline; running out counts as an upstream failure.
+    """
+
+    def __init__(self, transport=None, deadline=DEFAULT_DEADLINE):
+        self.transport = transport or AsyncTransport()
+        self.deadline = deadline
+        self._token_lock = None
+
+    async def _within(self, coroutine, deadline, endpoint, what):
+        """Await coroutine, cancelling it and returning None once the deadline passes"""
+        deadline = deadline or self.deadline
+        try:
+            return await asyncio.wait_for(coroutine, deadline)
+        except asyncio.TimeoutError:
+            error = TimeoutError(f"{what} exceeded its {deadline:g}s deadline")
+            record_upstream_health(endpoint, error=error)
+            print(f" {error}")
+            return None
+
+    async def _timed(self, endpoint, method, url, **kwargs):
+        """One request, recorded in the upstream metrics under the given endpoint label"""
+        started = time.perf_counter()
+        try:
+            response = await self.transport.request(method, url, **kwargs)
+        except BaseException:
+            # Includes being cancelled at the deadline
+            _record_upstream_error(endpoint, started)
+            raise
+        _record_upstream(endpoint, response, started)
+        return response
+
+    async def get_oauth_token(self, deadline=None):
+        """Get OAuth2 access token from OpenSky; None on failure"""
+        return await self._within(self._get_oauth_token(), deadline, 'flights', "OAuth2 token request")
+
+    async def _get_oauth_token(self):
+        global access_token, token_expiry
+        token = _cached_token()
+        if token:
+            return token
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            # Concurrent callers wait for a single refresh
+            token = _cached_token()
+            if token:
+                return token
+            metrics.TOKEN_CACHE.inc(result='miss')
+            print("Requesting new OAuth2 token...")
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                with span('token_refresh'):
+                    response = await self.transport.request('POST', OAUTH_TOKEN_URL, data={
+                        'grant_type': 'client_credentials',
+                        'client_id': CLIENT_ID,
+                        'client_secret': CLIENT_SECRET
+                    })
+                status = response.status_code
+            except Exception as e:
+                record_upstream_health('flights', error=e)
+                print(f"OAuth2 token request failed: {e!r}")
+                return None
+            finally:
+                metrics.TOKEN_REFRESH_LATENCY.observe(time.perf_counter() - started, status=status)
+            record_upstream_health('flights', response)
+            if response.status_code != 200:
+                print(f"OAuth2 token request failed: {response.status_code} - {response.text}")
+                return None
+            try:
+                with span('parse'):
+                    token = response.json()['access_token']
+            except Exception as e:
+                # A 200 without a usable token counts as a failure, like a failed request
+                record_upstream_health('flights', error=e)
+                print(f"OAuth2 token response unusable: {e!r}")
+                return None
+            access_token = token
             # Token expires in 30 minutes, set expiry to 25 minutes for safety
             token_expiry = time.time() + (25 * 60)
             print("OAuth2 token obtained successfully")
             return access_token
-        else:
-            print(f"OAuth2 token request failed: {response.status_code} - {response.text}")
+
+    async def fetch_all_states(self, deadline=None):
+        """/states/all as decoded JSON (no auth needed); None on failure"""
+        return await self._within(self._fetch_all_states(), deadline, 'states', "States request")
+
+    async def _fetch_all_states(self):
+        try:
+            response = await self._timed('states', 'GET', f"{OPENSKY_BASE_URL}/states/all")
+        except Exception as e:
+            record_upstream_health('states', error=e)
+            print(f"API request failed: {e!r}")
+            return None
+        record_upstream_health('states', response)
+        if response.status_code != 200:
+            print(f"API error: {response.status_code}")
+            return None
+        try:
+            with span('parse'):
+                return response.json()
+        except Exception as e:
+            # Malformed body - report it so callers serve the last good states
+            record_upstream_health('states', error=e)
+            print(f"API response unusable: {e!r}")
             return None
-            
-    except Exception as e:
-        print(f"OAuth2 token request failed: {e}")
-        return None
 
-def make_authenticated_request(url, params=None):
-    """Make authenticated request to OpenSky API"""
-    token = get_oauth_token()
-    if not token:
-        print("No OAuth2 token available")
-        return None
-    
-    try:
-        headers = {'Authorization': f'Bearer {token}'}
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 401:
+    async def fetch_states(self, wanted, deadline=None):
+        """/states/all filtered to the ICAO24 codes in `wanted` (lowercase); None on failure"""
+        data = await self.fetch_all_states(deadline)
+        if not data or 'states' not in data:
+            return None
+        try:
+            with span('parse'):
+                return [state for state in data['states'] or [] if state and state[0].lower() in wanted]
+        except Exception as e:
+            record_upstream_health('states', error=e)
+            print(f"API response unusable: {e!r}")
+            return None
+
+    async def fetch_flight_history(self, icao24, start_time, end_time, deadline=None):
+        """/flights/aircraft for one aircraft between two unix times; [] if it didn't fly, None on failure"""
+        return await self._within(self._fetch_flight_history(icao24, int(start_time), int(end_time)),
+                                  deadline, 'flights', f"Flight history request for {icao24}")
+
+    async def _fetch_flight_history(self, icao24, start_time, end_time, retry_on_401=True):
+        global access_token
+        token = await self._get_oauth_token()
+        if not token:
+            print("No OAuth2 token available")
+            return None
+        print(f"📡 Fetching flight history for {icao24}...")
+        params = {'icao24': icao24.lower(), 'begin': start_time, 'end': end_time}
+        try:
+            response = await self._timed('flights', 'GET', f"{OPENSKY_BASE_URL}/flights/aircraft",
+                                         params=params, headers={'Authorization': f'Bearer {token}'})
+        except Exception as e:
+            record_upstream_health('flights', error=e)
+            print(f" Flight history request failed for {icao24}: {e!r}")
+            return None
+        record_upstream_health('flights', response)
+        if response.status_code == 401 and retry_on_401:
             print("Token expired, refreshing...")
             # Token might be expired, clear it and retry once
-            global access_token
             access_token = None
-            return make_authenticated_request(url, params)
-        else:
-            print(f"Authenticated request failed: {response.status_code} - {response.text}")
+            return await self._fetch_flight_history(icao24, start_time, end_time, retry_on_401=False)
+        if response.status_code == 404:
+            return []  # OpenSky's answer when the aircraft had no flights in the window
+        if response.status_code != 200:
+            print(f" No flight history data for {icao24}: {response.status_code} - {response.text}")
+            return None
+        try:
+            with span('parse'):
+                flights_data = response.json()
+        except Exception as e:
+            record_upstream_health('flights', error=e)
+            print(f" Flight history response unusable for {icao24}: {e!r}")
             return None
-            
-    except Exception as e:
-        print(f" Authenticated request failed: {e}")
-        return None
+        print(f" Found {len(flights_data)} flights for {icao24}")
+        return flights_data
+
+    async def get_aircraft_states_with_meta(self, icao24_list, max_age=None, deadline=None):
+        """
+        Get current states plus freshness metadata ({'stale': ..., 'cached': ..., 'data_age_seconds': ...}).
+        States come from the configured source (see sources.py) - OpenSky unless STATE_SOURCE says otherwise.
+        States younger than max_age seconds are reused without calling OpenSky.
+        While the circuit is open, or if the request fails, the last good states are returned
+        immediately instead of waiting on OpenSky.
+        """
+        wanted = {icao.lower() for icao in icao24_list}
+        cache_key = ('states', tuple(sorted(wanted)))
+        source = get_state_source()
+        if source.local:
+            # Local receiver (STATE_SOURCE=sbs|beast): always current and free, so no poll-interval cache
+            states = source.get_states(wanted)
+            last_good.store(cache_key, states)
+            newest = max((state[4] or 0 for state in states), default=None)
+            return states, freshness(not source.connected, time.time() - newest if newest else None)
+        cached, meta = serve_cached(cache_key, max_age)
+        if cached is not None:
+            return cached, meta
+        if breakers['states'].allow_request():
+            states = await self.fetch_states(wanted, deadline)
+            if states is not None:
+                last_good.store(cache_key, states)
+                return states, freshness(False, 0)
+        return serve_stale('states', cache_key)
+
+    async def get_flight_history_with_meta(self, icao24, hours=48, max_age=None, deadline=None):
+        """Get flight history plus freshness metadata, falling back to the last good history"""
+        cache_key = ('flights', icao24.lower(), hours)
+        cached, meta = serve_cached(cache_key, max_age)
+        if cached is not None:
+            return cached, meta
+        if breakers['flights'].allow_request():
+            end_time = int(time.time())
+            flights_data = await self.fetch_flight_history(icao24, end_time - (hours * 3600), end_time, deadline)
+            if flights_data is not None:
+                last_good.store(cache_key, flights_data)
+                return flights_data, freshness(False, 0)
+        flights_data, meta = serve_stale('flights', cache_key)
+        return (flights_data if flights_data is not None else []), meta
+
+    async def get_comprehensive_aircraft_data(self, scheduler=None, deadline=None):
+        """
+        Get both current state and flight history for all tracked aircraft.
+        With a PollScheduler, data still inside its poll interval is reused instead of refetched.
+        The states request and every aircraft's history run concurrently (bounded by the
+        transport's semaphore), so the whole call finishes within one deadline.
+        """
+        icao24_list = [icao.lower() for icao in AIRCRAFT_MAP.values()]
+        states_max_age = scheduler.states_max_age() if scheduler else None
+
+        async def history(icao24):
+            max_age = scheduler.history_max_age(icao24) if scheduler else None
+            return await self.get_flight_history_with_meta(icao24, hours=24, max_age=max_age, deadline=deadline)
+
+        states_result, *history_results = await asyncio.gather(
+            self.get_aircraft_states_with_meta(icao24_list, states_max_age, deadline),
+            *(history(icao24) for icao24 in AIRCRAFT_MAP.values()))
+
+        current_states, states_meta = states_result
+        if scheduler and not states_meta['cached']:
+            scheduler.observe_states(current_states)
+            scheduler.mark_polled('states')
+        histories = {}
+        for icao24, (flight_history, history_meta) in zip(AIRCRAFT_MAP.values(), history_results):
+            if scheduler and not history_meta['cached']:
+                scheduler.mark_polled('flights', icao24)
+            histories[icao24.lower()] = (flight_history, history_meta)
+        return build_comprehensive_data(current_states, states_meta, histories)
+
+
+# The client behind the synchronous functions, on async_client's background loop
+shared_client = OpenSkyClient(shared_transport)
+
+def _forget_token_lock():
+    # A forked child gets a new background loop - the lock belonged to the parent's
+    shared_client._token_lock = None
+
+os.register_at_fork(after_in_child=_forget_token_lock)
+
+def _run(coroutine):
+    """Run a shared_client coroutine from synchronous code"""
+    return run_sync(coroutine, shared_client.deadline + RUN_SYNC_GRACE)
+
+def get_oauth_token():
+    """Get OAuth2 access token from OpenSky"""
+    return _run(shared_client.get_oauth_token())
 
 def get_all_states():
     """Get current aircraft states from OpenSky (no auth needed)"""
-    try:
-        url = f"{OPENSKY_BASE_URL}/states/all"
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"API error: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"API request failed: {e}")
-        return None
+    return _run(shared_client.fetch_all_states())
+
+def _fetch_aircraft_states(wanted):
+    """Request /states/all and keep only the ICAO24 codes in `wanted` (a set of lowercase codes)"""
+    return _run(shared_client.fetch_states(wanted))
+
+def get_aircraft_states_with_meta(icao24_list, max_age=None):
+    """Get current states plus freshness metadata - see OpenSkyClient.get_aircraft_states_with_meta"""
+    return _run(shared_client.get_aircraft_states_with_meta(icao24_list, max_age))
+
+def get_cached_aircraft_states(icao24_list):
+    """Last good states for these aircraft and their age in seconds - never calls OpenSky"""
+    wanted = {icao.lower() for icao in icao24_list}
+    return last_good.get(('states', tuple(sorted(wanted))))
 
 def get_aircraft_states(icao24_list):
     """Get current states for specific aircraft by ICAO24 codes"""
-    try:
-        url = f"{OPENSKY_BASE_URL}/states/all"
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if data and 'states' in data:
-                # Filter for our specific aircraft
-                our_aircraft = []
-                for state in data['states']:
-                    if state and state[0].lower() in [icao.lower() for icao in icao24_list]:
-                        our_aircraft.append(state)
-                return our_aircraft
-        return None
-    except Exception as e:
-        print(f"API request failed: {e}")
-        return None
+    states, _ = get_aircraft_states_with_meta(icao24_list)
+    return states
+
+def get_flight_history_with_meta(icao24, hours=48, max_age=None):
+    """Get flight history plus freshness metadata, falling back to the last good history"""
+    return _run(shared_client.get_flight_history_with_meta(icao24, hours, max_age))
 
 def get_flight_history(icao24, hours=48):
     """Get flight history with OAuth2 authentication"""
-    try:
-        end_time = int(time.time())
-        start_time = end_time - (hours * 3600)
-        
-        url = f"{OPENSKY_BASE_URL}/flights/aircraft"
-        params = {
-            'icao24': icao24.lower(),
-            'begin': start_time,
-            'end': end_time
-        }
-        
-        print(f"📡 Fetching flight history for {icao24}...")
-        
-        # Use authenticated request for flight history
-        flights_data = make_authenticated_request(url, params)
-        
-        if flights_data is not None:
-            print(f" Found {len(flights_data)} flights for {icao24}")
-            return flights_data
-        else:
-            print(f" No flight history data for {icao24}")
-            return []
-            
-    except Exception as e:
-        print(f" Flight history request failed for {icao24}: {e}")
-        return []
-
-def get_comprehensive_aircraft_data():
-    """Get both current state and flight history for all tracked aircraft"""
-    icao24_list = [icao.lower() for icao in AIRCRAFT_MAP.values()]
-    current_states = get_aircraft_states(icao24_list)
-    
+    flights_data, _ = get_flight_history_with_meta(icao24, hours)
+    return flights_data
+
+def fetch_flights_between(icao24, start_time, end_time):
+    """Request /flights/aircraft for one aircraft between two unix times; [] if it didn't fly, None if the request failed"""
+    return _run(shared_client.fetch_flight_history(icao24, start_time, end_time))
+
+def get_comprehensive_aircraft_data(scheduler=None):
+    """Get both current state and flight history for all tracked aircraft - see OpenSkyClient"""
+    return _run(shared_client.get_comprehensive_aircraft_data(scheduler))
+
+def build_comprehensive_data(current_states, states_meta, histories):
+    """Combine states and per-aircraft (flight_history, freshness) results into the comprehensive payload"""
     comprehensive_data = {}
     
     # Get current states
@@ -179,7 +429,6 @@ def get_comprehensive_aircraft_data():
                 'flight_history': []
             }
     
-    # Get flight history for all aircraft (even if not currently transmitting)
     for registration, icao24 in AIRCRAFT_MAP.items():
         icao24_lower = icao24.lower()
         
@@ -190,15 +439,15 @@ def get_comprehensive_aircraft_data():
                 'flight_history': []
             }
         
-        # Get flight history with authentication
-        flight_history = get_flight_history(icao24, hours=24)
+        flight_history, history_meta = histories[icao24_lower]
         comprehensive_data[icao24_lower]['flight_history'] = flight_history
+        comprehensive_data[icao24_lower]['freshness'] = {
+            'current_state': states_meta,
+            'flight_history': history_meta
+        }
         
         # Add registration info
         comprehensive_data[icao24_lower]['registration'] = registration
-        
-        # Be respectful to the API
-        time.sleep(1)
     
     return comprehensive_data
 
@@ -307,82 +556,6 @@ def test_comprehensive_tracking():
     print("🎯 COMPREHENSIVE TEST COMPLETE")
     print("=" * 80)
 
-# Flask routes for web interface
-@app.route('/')
-def index():
-    return jsonify({"message": "FFC Aircraft Tracker API", "status": "running"})
-
-@app.route('/api/live/all')
-def get_all_live_data():
-    """Get current live data for all tracked aircraft"""
-    try:
-        icao24_list = list(AIRCRAFT_MAP.values())
-        states = get_aircraft_states(icao24_list)
-        
-        aircraft_data = []
-        if states:
-            for state in states:
-                aircraft_data.append({
-                    'icao24': state[0],
-                    'callsign': state[1].strip() if state[1] else 'N/A',
-                    'latitude': state[6],
-                    'longitude': state[5],
-                    'altitude': state[7],
-                    'velocity': state[9],
-                    'heading': state[10],
-                    'vertical_rate': state[11],
-                    'on_ground': state[8],
-                    'last_contact': state[4]
-                })
-        
-        return jsonify({
-            'timestamp': int(time.time()),
-            'aircraft_count': len(aircraft_data),
-            'aircraft': aircraft_data
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/comprehensive/all')
-def get_comprehensive_data():
-    """Get both current state and flight history for all aircraft"""
-    try:
-        comprehensive_data = get_comprehensive_aircraft_data()
-        return jsonify({
-            'timestamp': int(time.time()),
-            'data': comprehensive_data
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/history/<registration>')
-def get_aircraft_history(registration):
-    """Get flight history for a specific aircraft"""
-    try:
-        if registration not in AIRCRAFT_MAP:
-            return jsonify({'error': 'Aircraft not in tracking list'}), 404
-            
-        icao24 = AIRCRAFT_MAP[registration]
-        flight_history = get_flight_history(icao24, hours=48)
-        
-        return jsonify({
-            'registration': registration,
-            'icao24': icao24,
-            'flight_history': flight_history,
-            'flight_count': len(flight_history)
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
 if __name__ == '__main__':
     # Run the comprehensive test
     test_comprehensive_tracking()
-    
-    # Then start the Flask server
-    print("\nStarting Flask server on http://localhost:5000")
-    print("Available endpoints:")
-    print("  /api/live/all - Current aircraft data only")
-    print("  /api/comprehensive/all - Current + flight history")
-    print("  /api/history/<registration> - Flight history for specific aircraft")
-    app.run(debug=True, port=5000)
\ No newline at end of file
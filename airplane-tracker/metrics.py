@@ -0,0 +1,221 @@
+# metrics.py
+# Lightweight in-process metrics for the FFC Small Aircraft Tracker
+# Records counters, gauges and latency histograms from fetch_data.py, database.py and app.py
+# and renders them in Prometheus text format for the /metrics endpoint
+import threading
+import time
+from contextlib import contextmanager
+
+# Default histogram buckets (seconds) - covers fast SQLite writes up to the 10s upstream timeout
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Histogram buckets for payload sizes (bytes) - /states/all can be several MB
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _format_labels(labelnames, values, extra=None):
+    """Build the {name="value",...} part of a metric line"""
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    """Prometheus wants +Inf spelled out and plain numbers otherwise"""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class - a named metric with optional labels"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing value (requests, bytes, credits...)"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (credits remaining, queue depth...)"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed distribution with sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager that observes the elapsed wall time in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['counts']):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ('le', _format_value(float(bound))))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric so /metrics can render them in one pass"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing  # Modules may be re-imported (Flask reloader), reuse the metric
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Return all metrics in Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Shared registry used by the whole app
+registry = MetricsRegistry()
+
+# Content type Prometheus expects for the text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upstream (OpenSky) metrics - fetch_data.py
+UPSTREAM_LATENCY = registry.histogram(
+    'ffc_upstream_request_seconds', 'Latency of OpenSky API requests', ('endpoint', 'status'))
+UPSTREAM_BYTES = registry.histogram(
+    'ffc_upstream_response_bytes', 'Size of OpenSky API response bodies', ('endpoint',), buckets=BYTE_BUCKETS)
+UPSTREAM_REQUESTS = registry.counter(
+    'ffc_upstream_requests_total', 'OpenSky API requests by outcome', ('endpoint', 'status'))
+CREDITS_USED = registry.counter(
+    'ffc_opensky_credits_used_total', 'Estimated OpenSky API credits consumed', ('endpoint',))
+CREDITS_REMAINING = registry.gauge(
+    'ffc_opensky_credits_remaining', 'Credits left according to the X-Rate-Limit-Remaining header', ('endpoint',))
+TOKEN_CACHE = registry.counter(
+    'ffc_oauth_token_cache_total', 'OAuth2 token lookups served from cache (hit) or refreshed (miss)', ('result',))
+TOKEN_REFRESH_LATENCY = registry.histogram(
+    'ffc_oauth_token_refresh_seconds', 'Latency of OAuth2 token refresh requests', ('status',))
+
+# Database metrics - database.py
+DB_WRITE_LATENCY = registry.histogram(
+    'ffc_db_write_seconds', 'SQLite write latency including commit', ('operation',))
+DB_QUERY_LATENCY = registry.histogram(
+    'ffc_db_query_seconds', 'SQLite read query latency', ('operation',))
+DB_ROWS_WRITTEN = registry.counter(
+    'ffc_db_rows_written_total', 'Rows written to SQLite', ('table',))
+DB_SAMPLES_SKIPPED = registry.counter(
+    'ffc_db_status_samples_skipped_total', 'Status samples not stored because nothing changed', ('reason',))
+
+# Flask request metrics - app.py
+HTTP_LATENCY = registry.histogram(
+    'ffc_http_request_seconds', 'Flask request latency', ('endpoint', 'method', 'status'))
+HTTP_RESPONSE_BYTES = registry.histogram(
+    'ffc_http_response_bytes', 'Flask response body sizes', ('endpoint',), buckets=BYTE_BUCKETS)
+JSON_SERIALIZE_LATENCY = registry.histogram(
+    'ffc_json_serialize_seconds', 'Time spent serializing JSON responses', ('endpoint',))
+
+
+def render():
+    """Shortcut used by the /metrics route"""
+    return registry.render()
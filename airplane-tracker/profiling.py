@@ -0,0 +1,163 @@
+# profiling.py
+# Per-request stage tracing and an on-demand sampling profiler for the FFC tracker
+# - span("upstream_fetch") records how long a stage of the current request took
+# - SamplingProfiler samples every thread's stack and writes flamegraph-compatible
+#   "folded" output (one "frame;frame;frame count" line per unique stack)
+import os
+import sys
+import time
+import threading
+import logging
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+# Requests slower than this (milliseconds) get logged with their stage breakdown
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 2000))
+
+# Where profiler output is written
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+# Longest profile the admin toggle will accept (seconds)
+MAX_PROFILE_SECONDS = 300
+
+# Trace for the request currently being handled by this thread/context (None outside requests)
+_current_trace = contextvars.ContextVar('ffc_trace', default=None)
+
+
+class RequestTrace:
+    """Collects the stage spans recorded while handling one request"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []  # (stage, duration_seconds) in completion order
+
+    def add(self, stage, duration):
+        self.spans.append((stage, duration))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def stage_totals(self):
+        """Sum spans with the same stage name (e.g. four flight history fetches)"""
+        totals = {}
+        for stage, duration in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + duration
+        return totals
+
+    def server_timing(self):
+        """Format the stage totals as a Server-Timing header value"""
+        return ', '.join(f"{stage};dur={duration * 1000:.1f}" for stage, duration in self.stage_totals().items())
+
+    def summary(self):
+        stages = ', '.join(f"{stage}={duration * 1000:.0f}ms" for stage, duration in self.stage_totals().items())
+        return f"{self.name} took {self.elapsed() * 1000:.0f}ms [{stages or 'no stages recorded'}]"
+
+
+def start_trace(name):
+    """Begin tracing a request; returns the token needed by finish_trace()"""
+    return _current_trace.set(RequestTrace(name))
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def finish_trace(token):
+    """Stop tracing, log the request if it was slow and return the finished trace"""
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    if trace is not None and trace.elapsed() * 1000 >= SLOW_REQUEST_MS:
+        logging.warning(f"Slow request: {trace.summary()}")
+    return trace
+
+
+@contextmanager
+def span(stage):
+    """Time a stage of the current request - a no-op cost when nothing is being traced"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, time.perf_counter() - started)
+
+
+class SamplingProfiler:
+    """Samples all thread stacks at a fixed interval for a limited time"""
+
+    def __init__(self, output_dir=PROFILE_DIR, interval=0.005):
+        self.output_dir = output_dir
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.running_until = None
+        self.last_output = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds):
+        """Start profiling for `seconds`; returns False if a profile is already running"""
+        seconds = max(1, min(int(seconds), MAX_PROFILE_SECONDS))
+        with self._lock:
+            if self.is_running():
+                return False
+            self._stop.clear()
+            self.running_until = time.time() + seconds
+            self._thread = threading.Thread(target=self._run, args=(seconds,), daemon=True, name='ffc-profiler')
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Stop early; whatever was sampled so far is still written"""
+        self._stop.set()
+
+    def status(self):
+        return {
+            'running': self.is_running(),
+            'running_until': int(self.running_until) if self.is_running() else None,
+            'interval_ms': self.interval * 1000,
+            'last_output': self.last_output
+        }
+
+    def _run(self, seconds):
+        own_id = threading.get_ident()
+        thread_names = {}
+        stacks = Counter()
+        deadline = time.perf_counter() + seconds
+
+        while time.perf_counter() < deadline and not self._stop.is_set():
+            for thread in threading.enumerate():
+                thread_names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                frames.append(thread_names.get(thread_id, str(thread_id)))
+                stacks[';'.join(reversed(frames))] += 1
+            time.sleep(self.interval)
+
+        self.last_output = self._write(stacks)
+        logging.info(f"Profile written to {self.last_output} ({sum(stacks.values())} samples)")
+
+    def _write(self, stacks):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+# Shared profiler toggled through the admin endpoint
+profiler = SamplingProfiler()
@@ -0,0 +1,147 @@
+# resilience.py
+# Upstream health tracking for OpenSky requests
+# - CircuitBreaker stops calling OpenSky after repeated failures and backs off exponentially,
+#   honoring the rate-limit headers OpenSky sends with 429 responses
+# - LastGoodCache keeps the most recent successful result so it can be served (with its age)
+#   while the upstream is unavailable
+import random
+import threading
+import time
+import logging
+
+import metrics
+
+CLOSED = 'closed'        # Upstream healthy - requests go through
+OPEN = 'open'            # Upstream failing - requests are skipped until the backoff expires
+HALF_OPEN = 'half_open'  # Backoff expired - one probe request is allowed through
+
+# A probe whose outcome was never reported is replaced by a new one after this many seconds
+PROBE_TIMEOUT = 60
+
+BREAKER_STATE = metrics.registry.gauge(
+    'ffc_upstream_breaker_open', '1 when the circuit breaker for an upstream endpoint is open', ('endpoint',))
+STALE_SERVED = metrics.registry.counter(
+    'ffc_upstream_stale_served_total', 'Responses served from the last good result instead of OpenSky', ('endpoint',))
+
+
+def retry_after_seconds(response):
+    """Read how long OpenSky wants us to wait from a response's headers (None if not given)"""
+    for header in ('X-Rate-Limit-Retry-After-Seconds', 'Retry-After'):
+        value = response.headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            continue
+    return None
+
+
+class CircuitBreaker:
+    """Tracks the health of one upstream endpoint"""
+
+    def __init__(self, name, failure_threshold=3, base_backoff=5.0, max_backoff=600.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_count = 0       # How many times in a row we have opened (drives the exponential backoff)
+        self.open_until = 0.0
+        self.probe_started = 0.0
+        self.last_error = None
+        BREAKER_STATE.set(0, endpoint=name)
+
+    def allow_request(self):
+        """True if a request should be sent now; False means serve cached data instead"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.time()
+            if (self.state == OPEN and now >= self.open_until) or \
+                    (self.state == HALF_OPEN and now - self.probe_started >= PROBE_TIMEOUT):
+                # Let exactly one probe through; everyone else keeps getting cached data
+                self.state = HALF_OPEN
+                self.probe_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logging.info(f"Upstream '{self.name}' recovered - closing circuit")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.open_count = 0
+            self.last_error = None
+            BREAKER_STATE.set(0, endpoint=self.name)
+
+    def record_failure(self, error=None, retry_after=None):
+        """
+        Count a failed request. A rate-limit response (retry_after given) or a failed
+        half-open probe opens the circuit immediately; otherwise it opens after
+        failure_threshold consecutive failures.
+        """
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error else None
+            if self.state == HALF_OPEN or retry_after is not None or \
+                    self.consecutive_failures >= self.failure_threshold:
+                self._open(retry_after)
+
+    def _open(self, retry_after):
+        self.open_count += 1
+        if retry_after is not None:
+            backoff = min(retry_after, self.max_backoff)
+        else:
+            # Exponential backoff with full jitter on the top half to avoid synchronized retries
+            ceiling = min(self.max_backoff, self.base_backoff * (2 ** (self.open_count - 1)))
+            backoff = random.uniform(ceiling / 2, ceiling)
+        self.state = OPEN
+        self.open_until = time.time() + backoff
+        BREAKER_STATE.set(1, endpoint=self.name)
+        logging.warning(f"Upstream '{self.name}' unavailable - circuit open for {backoff:.0f}s ({self.last_error})")
+
+    def status(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'retry_in_seconds': max(0, round(self.open_until - time.time())) if self.state == OPEN else 0,
+                'last_error': self.last_error
+            }
+
+
+class LastGoodCache:
+    """Most recent successful result per key, with the time it was fetched"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+
+    def get(self, key):
+        """Return (value, age_seconds), or (None, None) if nothing has been cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None, None
+        value, fetched_at = entry
+        return value, time.time() - fetched_at
+
+
+def freshness(stale, age, cached=False):
+    """
+    Metadata attached to API responses so the dashboard can show how old the data is.
+    cached=True means the data was reused on purpose (still within its poll interval).
+    """
+    return {
+        'stale': stale,
+        'cached': cached or stale,
+        'data_age_seconds': int(age) if age is not None else None
+    }
@@ -0,0 +1,213 @@
+# scheduler.py
+# Adaptive polling plan for OpenSky requests
+# Poll intervals follow flight activity (airborne / taxiing / parked / not transmitting)
+# and are stretched when the remaining daily credit budget would not last until the reset
+import math
+import os
+import threading
+import time
+
+import metrics
+
+# Daily OpenSky credit budget (anonymous users get 400, registered users 4000)
+DAILY_CREDIT_BUDGET = int(os.environ.get('OPENSKY_DAILY_CREDITS', 4000))
+
+# Share of the budget reserved for /states/all - the rest goes to flight history
+STATES_BUDGET_SHARE = 0.75
+
+# Credit cost per request (a global /states/all query costs 4 credits)
+STATES_CREDIT_COST = 4
+FLIGHTS_CREDIT_COST = 1
+
+# Base poll intervals (seconds) per activity level: (states, flight history)
+ACTIVITY_INTERVALS = {
+    'airborne': (10, 900),            # OpenSky positions refresh every ~10s; history only changes after landing
+    'taxiing': (30, 900),             # Moving on the ground - about to depart or just landed
+    'just_landed': (30, 120),         # Landed in the last 15 minutes - the new flight shows up in history soon
+    'parked': (300, 3600),            # On the ground and stationary
+    'not_transmitting': (600, 3600),  # Transponder off / out of coverage
+}
+
+# How long after touchdown an aircraft counts as 'just_landed'
+JUST_LANDED_WINDOW = 15 * 60
+
+# Ground speed (m/s) above which an aircraft on the ground is considered taxiing
+TAXI_SPEED = 2.5
+
+
+def _distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points (haversine)"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def seconds_until_reset(now=None):
+    """Seconds until OpenSky's daily credit reset (midnight UTC)"""
+    now = time.time() if now is None else now
+    return 86400 - (now % 86400)
+
+
+class DailyCredits:
+    """Credits spent, and the last X-Rate-Limit-Remaining seen, during the current UTC day"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = None
+        self._used = {}        # endpoint -> credits spent today
+        self._reported = {}    # endpoint -> remaining credits reported today
+
+    def _roll_over(self, now):
+        # OpenSky resets credits at midnight UTC - so do we (called with the lock held)
+        day = int(now // 86400)
+        if day != self._day:
+            self._day = day
+            self._used = {}
+            self._reported = {}
+
+    def record(self, endpoint, used=0, remaining=None, now=None):
+        """Add the cost of one response and the remaining credits it reported (if any)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._roll_over(now)
+            self._used[endpoint] = self._used.get(endpoint, 0) + used
+            if remaining is not None:
+                self._reported[endpoint] = remaining
+
+    def used(self, now=None):
+        with self._lock:
+            self._roll_over(time.time() if now is None else now)
+            return sum(self._used.values())
+
+    def reported_remaining(self, now=None):
+        """Lowest remaining count OpenSky reported today, or None"""
+        with self._lock:
+            self._roll_over(time.time() if now is None else now)
+            return min(self._reported.values()) if self._reported else None
+
+
+# Shared by fetch_data (which records every response) and the schedulers
+daily_credits = DailyCredits()
+
+
+class PollScheduler:
+    """Decides when states and flight history are due, per aircraft"""
+
+    def __init__(self, aircraft_map, daily_budget=DAILY_CREDIT_BUDGET):
+        self.aircraft_map = dict(aircraft_map)
+        self.daily_budget = daily_budget
+        self._lock = threading.Lock()
+        self._activity = {}       # icao24 -> {'on_ground', 'moving', 'landed_at', 'position', 'seen_at'}
+        self._last_polled = {}    # ('states', None) / ('flights', icao24) -> timestamp
+
+    # Observations
+
+    def observe_states(self, states, now=None):
+        """Update activity from a /states/all result (OpenSky state vectors for our aircraft)"""
+        now = time.time() if now is None else now
+        seen = set()
+        with self._lock:
+            for state in states or []:
+                icao24 = state[0].lower()
+                seen.add(icao24)
+                previous = self._activity.get(icao24, {})
+                position = (state[6], state[5]) if state[6] is not None and state[5] is not None else None
+                on_ground = bool(state[8])
+                velocity = state[9] or 0
+
+                moved = velocity > TAXI_SPEED
+                if position and previous.get('position'):
+                    moved = moved or _distance_km(*previous['position'], *position) > 0.1
+
+                landed_at = previous.get('landed_at')
+                if on_ground and previous.get('on_ground') is False:
+                    landed_at = now  # Airborne -> on ground transition
+
+                self._activity[icao24] = {
+                    'on_ground': on_ground,
+                    'moving': moved,
+                    'landed_at': landed_at,
+                    'position': position or previous.get('position'),
+                    'seen_at': now
+                }
+
+            # Aircraft missing from the result are not transmitting
+            for icao24 in self.aircraft_map.values():
+                icao24 = icao24.lower()
+                if icao24 not in seen and icao24 in self._activity:
+                    self._activity[icao24]['seen_at'] = None
+
+    def mark_polled(self, kind, icao24=None, now=None):
+        """Record that states (icao24=None) or one aircraft's history was just fetched"""
+        with self._lock:
+            self._last_polled[(kind, icao24.lower() if icao24 else None)] = time.time() if now is None else now
+
+    # Planning
+
+    def activity(self, icao24, now=None):
+        """Classify one aircraft into an ACTIVITY_INTERVALS level"""
+        now = time.time() if now is None else now
+        info = self._activity.get(icao24.lower())
+        if not info or info['seen_at'] is None:
+            return 'not_transmitting'
+        if not info['on_ground']:
+            return 'airborne'
+        if info['landed_at'] and now - info['landed_at'] < JUST_LANDED_WINDOW:
+            return 'just_landed'
+        return 'taxiing' if info['moving'] else 'parked'
+
+    def credits_remaining(self, now=None):
+        """Credits left today - from OpenSky's X-Rate-Limit-Remaining header when we have seen it today"""
+        reported = daily_credits.reported_remaining(now)
+        if reported is not None:
+            return reported
+        return max(0, self.daily_budget - daily_credits.used(now))
+
+    def budget_intervals(self, now=None):
+        """Shortest sustainable (states, per-aircraft history) intervals for the rest of the day"""
+        remaining_time = seconds_until_reset(now)
+        credits = self.credits_remaining(now)
+        if credits <= 0:
+            return remaining_time, remaining_time  # Out of credits - wait for the reset
+        states_polls = credits * STATES_BUDGET_SHARE / STATES_CREDIT_COST
+        history_polls = credits * (1 - STATES_BUDGET_SHARE) / (FLIGHTS_CREDIT_COST * max(1, len(self.aircraft_map)))
+        return remaining_time / states_polls, remaining_time / history_polls
+
+    def plan(self, now=None):
+        """Current polling plan: per-aircraft intervals plus the shared /states/all interval"""
+        now = time.time() if now is None else now
+        states_budget, history_budget = self.budget_intervals(now)
+        aircraft = {}
+        with self._lock:
+            for registration, icao24 in self.aircraft_map.items():
+                icao24 = icao24.lower()
+                level = self.activity(icao24, now)
+                states_interval, history_interval = ACTIVITY_INTERVALS[level]
+                aircraft[icao24] = {
+                    'registration': registration,
+                    'activity': level,
+                    'states_interval_seconds': states_interval,
+                    'history_interval_seconds': round(max(history_interval, history_budget)),
+                    'history_last_polled': self._last_polled.get(('flights', icao24))
+                }
+            states_last_polled = self._last_polled.get(('states', None))
+
+        # One /states/all request covers every aircraft, so the most active one sets the pace
+        wanted = min(a['states_interval_seconds'] for a in aircraft.values()) if aircraft else 300
+        return {
+            'generated_at': int(now),
+            'credits_remaining': self.credits_remaining(now),
+            'seconds_until_credit_reset': int(seconds_until_reset(now)),
+            'states_interval_seconds': round(max(wanted, states_budget)),
+            'states_budget_limited': states_budget > wanted,
+            'states_last_polled': states_last_polled,
+            'aircraft': aircraft
+        }
+
+    def states_max_age(self, now=None):
+        """How old cached states may be before /states/all should be polled again"""
+        return self.plan(now)['states_interval_seconds']
+
+    def history_max_age(self, icao24, now=None):
+        """How old one aircraft's cached flight history may be before it is fetched again"""
+        return self.plan(now)['aircraft'][icao24.lower()]['history_interval_seconds']
@@ -0,0 +1,480 @@
+# sources.py
+# Pluggable sources of aircraft state vectors for get_aircraft_states()
+# - OpenSkySource: the OpenSky REST API (default)
+# - SBSSource:     a local receiver's dump1090 SBS/BaseStation output (TCP port 30003)
+# - BeastSource:   a local receiver's Beast binary output (TCP port 30005), decoded here
+# The streaming sources keep a background TCP connection open, decode messages
+# incrementally and keep the latest OpenSky-shaped state vector per aircraft, so
+# updates are sub-second and cost no API credits.
+#
+# Choose with STATE_SOURCE=opensky|sbs|beast (plus ADSB_HOST / ADSB_PORT).
+# For testing, `python sources.py replay capture.sbs --port 30003` serves a recorded
+# capture on a local socket.
+import math
+import os
+import socket
+import sys
+import threading
+import time
+import logging
+
+# Receiver position - used as the reference for decoding Beast CPR positions
+# (defaults to the Fox Flying Club area the map is centred on)
+REFERENCE_LAT = float(os.environ.get('ADSB_REF_LAT', 41.9200))
+REFERENCE_LON = float(os.environ.get('ADSB_REF_LON', -88.2417))
+
+# Aircraft not heard from for this long are no longer reported
+STALE_AFTER_SECONDS = 60
+
+# Unit conversions to the OpenSky state vector units (metres, m/s)
+FEET_TO_M = 0.3048
+KNOTS_TO_MS = 0.514444
+FPM_TO_MS = 0.00508
+
+# OpenSky position_source value for ADS-B
+POSITION_SOURCE_ADSB = 0
+
+
+def new_state(icao24):
+    """Empty OpenSky-style state vector (17 fields) for one aircraft"""
+    return [icao24, None, None, None, None, None, None, None, False, None, None, None, None, None, None, False,
+            POSITION_SOURCE_ADSB]
+
+
+class StateSource:
+    """Interface every source implements"""
+    name = 'base'
+    local = False  # True for receivers on our own network (no credits, no poll interval)
+
+    def get_states(self, icao24_list):
+        """Return state vectors for the given ICAO24 codes (lowercase), or None if unavailable"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class OpenSkySource(StateSource):
+    """OpenSky REST API - one /states/all request per call"""
+    name = 'opensky'
+
+    def get_states(self, icao24_list):
+        from fetch_data import _fetch_aircraft_states  # Imported here - fetch_data imports this module
+        return _fetch_aircraft_states({icao.lower() for icao in icao24_list})
+
+
+class StreamingSource(StateSource):
+    """Reads a receiver's TCP output on a background thread and keeps the latest state per aircraft"""
+    local = True
+
+    def __init__(self, host, port, reconnect_delay=2.0, max_reconnect_delay=60.0):
+        self.host = host
+        self.port = port
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connected = False
+        self.messages = 0
+        self._states = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f'ffc-{self.name}-source')
+        self._thread.start()
+
+    def get_states(self, icao24_list):
+        cutoff = time.time() - STALE_AFTER_SECONDS
+        with self._lock:
+            return [
+                list(state) for icao24, state in self._states.items()
+                if icao24 in icao24_list and (state[4] or 0) >= cutoff
+            ]
+
+    def close(self):
+        self._stop.set()
+
+    def _update(self, icao24, **fields):
+        """Merge decoded fields into an aircraft's state vector"""
+        now = time.time()
+        with self._lock:
+            state = self._states.get(icao24)
+            if state is None:
+                state = self._states[icao24] = new_state(icao24)
+            for index, value in fields.items():
+                state[int(index)] = value
+            state[4] = now  # last_contact
+            if '5' in fields:
+                state[3] = now  # time_position
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            try:
+                with socket.create_connection((self.host, self.port), timeout=10) as sock:
+                    sock.settimeout(30)
+                    self.connected = True
+                    delay = self.reconnect_delay
+                    logging.info(f"Connected to {self.name} feed at {self.host}:{self.port}")
+                    self.reset_decoder()
+                    while not self._stop.is_set():
+                        chunk = sock.recv(65536)
+                        if not chunk:
+                            break
+                        self.feed(chunk)
+            except OSError as e:
+                logging.warning(f"{self.name} feed {self.host}:{self.port} unavailable: {e}")
+            self.connected = False
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def reset_decoder(self):
+        """Drop any partial message left over from a previous connection"""
+
+    def feed(self, data):
+        """Decode as much of `data` as possible, keeping partial messages for the next call"""
+        raise NotImplementedError
+
+
+# SBS / BaseStation (dump1090 port 30003)
+# MSG,<type>,<session>,<aircraft>,<hex>,<flight>,<date gen>,<time gen>,<date log>,<time log>,
+#     <callsign>,<altitude ft>,<ground speed kt>,<track>,<lat>,<lon>,<vertical rate ft/min>,
+#     <squawk>,<alert>,<emergency>,<spi>,<on ground>
+
+def _sbs_float(value):
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _sbs_flag(value):
+    return value in ('-1', '1')
+
+
+def parse_sbs_line(line):
+    """Turn one SBS line into (icao24, {state index: value}) or None if it carries nothing we use"""
+    fields = line.strip().split(',')
+    if len(fields) < 22 or fields[0] != 'MSG' or not fields[4]:
+        return None
+    icao24 = fields[4].strip().lower()
+    update = {}
+    if fields[10].strip():
+        update['1'] = fields[10].strip()
+    altitude = _sbs_float(fields[11])
+    if altitude is not None:
+        update['7'] = altitude * FEET_TO_M
+    speed = _sbs_float(fields[12])
+    if speed is not None:
+        update['9'] = speed * KNOTS_TO_MS
+    track = _sbs_float(fields[13])
+    if track is not None:
+        update['10'] = track
+    lat, lon = _sbs_float(fields[14]), _sbs_float(fields[15])
+    if lat is not None and lon is not None:
+        update['6'] = lat
+        update['5'] = lon
+    vertical_rate = _sbs_float(fields[16])
+    if vertical_rate is not None:
+        update['11'] = vertical_rate * FPM_TO_MS
+    if fields[17].strip():
+        update['14'] = fields[17].strip()
+    if fields[20]:
+        update['15'] = _sbs_flag(fields[20])
+    if fields[21]:
+        update['8'] = _sbs_flag(fields[21])
+    return icao24, update
+
+
+class SBSSource(StreamingSource):
+    """dump1090-style SBS/BaseStation text feed"""
+    name = 'sbs'
+
+    def reset_decoder(self):
+        self._buffer = b''
+
+    def feed(self, data):
+        self._buffer = getattr(self, '_buffer', b'') + data
+        *lines, self._buffer = self._buffer.split(b'\n')
+        for line in lines:
+            parsed = parse_sbs_line(line.decode('ascii', errors='replace'))
+            if parsed:
+                self.messages += 1
+                self._update(parsed[0], **parsed[1])
+
+
+# Beast binary (dump1090 port 30005)
+# <0x1a> <type> <6-byte MLAT timestamp> <1-byte signal> <message>, with 0x1a bytes inside
+# the frame escaped as 0x1a 0x1a. Type '1' = Mode A/C (2 bytes), '2' = Mode S short (7),
+# '3' = Mode S long (14). Only long DF17/18 extended squitters carry ADS-B state.
+
+BEAST_ESCAPE = 0x1a
+BEAST_MESSAGE_LENGTHS = {0x31: 2, 0x32: 7, 0x33: 14}
+
+# Mode S CRC-24 generator polynomial
+CRC_GENERATOR = 0xFFF409
+_CRC_TABLE = []
+for _byte in range(256):
+    _crc = _byte << 16
+    for _ in range(8):
+        _crc = ((_crc << 1) ^ CRC_GENERATOR) if _crc & 0x800000 else (_crc << 1)
+    _CRC_TABLE.append(_crc & 0xFFFFFF)
+
+CALLSIGN_CHARSET = '#ABCDEFGHIJKLMNOPQRSTUVWXYZ##### ###############0123456789######'
+
+
+def modes_crc_ok(message):
+    """An extended squitter's 24-bit parity field leaves a zero remainder when intact"""
+    crc = 0
+    for byte in message[:-3]:
+        crc = ((crc << 8) & 0xFFFFFF) ^ _CRC_TABLE[((crc >> 16) ^ byte) & 0xFF]
+    return crc == int.from_bytes(message[-3:], 'big')
+
+
+def _bits(value, start, length, width=56):
+    """Extract `length` bits starting at `start` (0 = most significant) from a `width`-bit integer"""
+    return (value >> (width - start - length)) & ((1 << length) - 1)
+
+
+def cpr_nl(lat):
+    """Number of longitude zones at a latitude (CPR NL function)"""
+    lat = abs(lat)
+    if lat == 0:
+        return 59
+    if lat == 87:
+        return 2
+    if lat > 87:
+        return 1
+    a = 1 - math.cos(math.pi / (2 * 15))
+    b = math.cos(math.pi / 180 * lat) ** 2
+    return int(math.floor(2 * math.pi / math.acos(1 - a / b)))
+
+
+def cpr_decode_local(odd, lat_cpr, lon_cpr, ref_lat, ref_lon, surface=False):
+    """Locally unambiguous CPR decode relative to a reference within ~180NM (45NM on the surface)"""
+    span = 90.0 if surface else 360.0
+    lat_cpr /= 131072.0
+    lon_cpr /= 131072.0
+    dlat = span / (60 - odd)
+    j = math.floor(ref_lat / dlat) + math.floor(0.5 + (ref_lat % dlat) / dlat - lat_cpr)
+    lat = dlat * (j + lat_cpr)
+    dlon = span / max(cpr_nl(lat) - odd, 1)
+    m = math.floor(ref_lon / dlon) + math.floor(0.5 + (ref_lon % dlon) / dlon - lon_cpr)
+    lon = dlon * (m + lon_cpr)
+    return lat, lon
+
+
+def decode_altitude(code):
+    """12-bit altitude field in feet (25ft increments only - Gillham-coded altitudes are skipped)"""
+    if not code or not (code & 0x10):
+        return None
+    n = ((code & 0xFE0) >> 1) | (code & 0x00F)
+    return n * 25 - 1000
+
+
+def decode_surface_speed(movement):
+    """Surface movement field to ground speed in knots"""
+    if movement == 1:
+        return 0.0
+    if 2 <= movement <= 8:
+        return 0.125 + (movement - 2) * 0.125
+    if 9 <= movement <= 12:
+        return 1 + (movement - 9) * 0.25
+    if 13 <= movement <= 38:
+        return 2 + (movement - 13) * 0.5
+    if 39 <= movement <= 93:
+        return 15 + (movement - 39)
+    if 94 <= movement <= 108:
+        return 70 + (movement - 94) * 2
+    if 109 <= movement <= 123:
+        return 100 + (movement - 109) * 5
+    if movement == 124:
+        return 175.0
+    return None
+
+
+def decode_extended_squitter(message, reference):
+    """
+    Decode a 14-byte DF17/18 message into (icao24, {state index: value}).
+    `reference` is (lat, lon) used for local CPR decoding. Returns None for messages
+    we don't use or that fail the parity check.
+    """
+    df = message[0] >> 3
+    if df not in (17, 18) or not modes_crc_ok(message):
+        return None
+    icao24 = message[1:4].hex()
+    me = int.from_bytes(message[4:11], 'big')
+    tc = _bits(me, 0, 5)
+    update = {}
+
+    if 1 <= tc <= 4:
+        # Identification - 8 six-bit characters
+        callsign = ''.join(CALLSIGN_CHARSET[_bits(me, 8 + 6 * i, 6)] for i in range(8))
+        update['1'] = callsign.replace('#', '').strip()
+    elif 5 <= tc <= 8 or 9 <= tc <= 18:
+        surface = tc <= 8
+        odd = _bits(me, 21, 1)
+        lat, lon = cpr_decode_local(odd, _bits(me, 22, 17), _bits(me, 39, 17), *reference, surface=surface)
+        if not (-90 <= lat <= 90):
+            return None
+        update['6'] = lat
+        update['5'] = lon
+        update['8'] = surface
+        if surface:
+            speed = decode_surface_speed(_bits(me, 5, 7))
+            if speed is not None:
+                update['9'] = speed * KNOTS_TO_MS
+            if _bits(me, 12, 1):
+                update['10'] = _bits(me, 13, 7) * 360.0 / 128
+        else:
+            altitude = decode_altitude(_bits(me, 8, 12))
+            if altitude is not None:
+                update['7'] = altitude * FEET_TO_M
+    elif tc == 19:
+        subtype = _bits(me, 5, 3)
+        if subtype in (1, 2):
+            # Ground speed as east/west and north/south components
+            factor = 4 if subtype == 2 else 1
+            v_ew, v_ns = _bits(me, 14, 10), _bits(me, 25, 10)
+            if v_ew and v_ns:
+                vx = (v_ew - 1) * factor * (-1 if _bits(me, 13, 1) else 1)
+                vy = (v_ns - 1) * factor * (-1 if _bits(me, 24, 1) else 1)
+                update['9'] = math.hypot(vx, vy) * KNOTS_TO_MS
+                update['10'] = math.degrees(math.atan2(vx, vy)) % 360
+        elif subtype in (3, 4):
+            # Airspeed and heading
+            if _bits(me, 13, 1):
+                update['10'] = _bits(me, 14, 10) * 360.0 / 1024
+            airspeed = _bits(me, 25, 10)
+            if airspeed:
+                update['9'] = (airspeed - 1) * (4 if subtype == 4 else 1) * KNOTS_TO_MS
+        vertical_rate = _bits(me, 37, 9)
+        if vertical_rate:
+            update['11'] = (vertical_rate - 1) * 64 * (-1 if _bits(me, 36, 1) else 1) * FPM_TO_MS
+        update['8'] = False
+    else:
+        return None
+
+    return icao24, update
+
+
+class BeastSource(StreamingSource):
+    """Beast binary feed, decoded incrementally frame by frame"""
+    name = 'beast'
+
+    def reset_decoder(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        buffer = getattr(self, '_buffer', None)
+        if buffer is None:
+            buffer = self._buffer = bytearray()
+        buffer.extend(data)
+        while True:
+            frame, consumed = self._next_frame(buffer)
+            if consumed == 0:
+                return  # Incomplete frame - wait for more data
+            del buffer[:consumed]
+            if frame is not None:
+                self._handle(frame)
+
+    @staticmethod
+    def _next_frame(buffer):
+        """
+        Find the next complete frame. Returns (message or None, bytes consumed);
+        consumed == 0 means more data is needed.
+        """
+        start = buffer.find(BEAST_ESCAPE)
+        if start < 0:
+            return None, len(buffer)  # No frame start - discard
+        if start + 1 >= len(buffer):
+            return None, start
+        frame_type = buffer[start + 1]
+        length = BEAST_MESSAGE_LENGTHS.get(frame_type)
+        if length is None:
+            return None, start + 1  # Unknown type / escaped 0x1a between frames - resync
+        # Unescape timestamp (6) + signal (1) + message
+        wanted = 7 + length
+        payload = bytearray()
+        i = start + 2
+        while len(payload) < wanted:
+            if i >= len(buffer):
+                return None, 0 if start == 0 else start
+            byte = buffer[i]
+            if byte == BEAST_ESCAPE:
+                if i + 1 >= len(buffer):
+                    return None, 0 if start == 0 else start
+                if buffer[i + 1] != BEAST_ESCAPE:
+                    return None, i  # Frame cut short - resync on the new frame start
+                i += 1
+            payload.append(byte)
+            i += 1
+        message = bytes(payload[7:]) if frame_type == 0x33 else None
+        return message, i
+
+    def _handle(self, message):
+        with self._lock:
+            known = self._states.get(message[1:4].hex())
+            reference = (known[6], known[5]) if known and known[6] is not None else (REFERENCE_LAT, REFERENCE_LON)
+        decoded = decode_extended_squitter(message, reference)
+        if decoded:
+            self.messages += 1
+            self._update(decoded[0], **decoded[1])
+
+
+# Source selection
+
+_source = None
+_source_lock = threading.Lock()
+
+def create_source(kind=None):
+    """Build the configured source (STATE_SOURCE, ADSB_HOST, ADSB_PORT)"""
+    kind = (kind or os.environ.get('STATE_SOURCE', 'opensky')).lower()
+    host = os.environ.get('ADSB_HOST', '127.0.0.1')
+    if kind == 'sbs':
+        return SBSSource(host, int(os.environ.get('ADSB_PORT', 30003)))
+    if kind == 'beast':
+        return BeastSource(host, int(os.environ.get('ADSB_PORT', 30005)))
+    if kind != 'opensky':
+        logging.warning(f"Unknown STATE_SOURCE '{kind}', using OpenSky")
+    return OpenSkySource()
+
+def get_state_source():
+    """Shared source, created (and for receivers, connected) on first use"""
+    global _source
+    if _source is None:
+        with _source_lock:
+            if _source is None:
+                _source = create_source()
+    return _source
+
+
+# Replay server for testing without a receiver
+
+def serve_replay(path, port, host='127.0.0.1', chunk_size=512, delay=0.01, loop=True):
+    """Serve a recorded SBS or Beast capture to every client that connects"""
+    with open(path, 'rb') as f:
+        capture = f.read()
+    server = socket.create_server((host, port))
+    print(f"Replaying {path} ({len(capture)} bytes) on {host}:{port}")
+
+    def stream(conn):
+        with conn:
+            try:
+                while True:
+                    for offset in range(0, len(capture), chunk_size):
+                        conn.sendall(capture[offset:offset + chunk_size])
+                        time.sleep(delay)
+                    if not loop:
+                        return
+            except OSError:
+                return
+
+    while True:
+        conn, _ = server.accept()
+        threading.Thread(target=stream, args=(conn,), daemon=True).start()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == 'replay':
+        port = int(sys.argv[sys.argv.index('--port') + 1]) if '--port' in sys.argv else 30003
+        serve_replay(sys.argv[2], port)
+    else:
+        print("Usage: python sources.py replay <capture file> [--port 30003]")
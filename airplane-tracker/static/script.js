@@ -20,25 +20,40 @@ loadData();
 let map = L.map('map').setView([41.9200, -88.2417], 10); // centered on Fox Flying Club
 L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png').addTo(map);
 
-let aircraftMarkers = [];
 let autoRefreshInterval = null;
+let serverPollSeconds = 30; // Poll interval suggested by the server's adaptive scheduler (next_poll_seconds)
 
-// existing loadData function, enhanced
-async function loadData() {
+// Markers keyed by icao24 so refreshes move existing markers instead of recreating them
+// Each entry: { marker, plane, iconKey }
+const aircraftMarkers = new Map();
+
+// Above this many aircraft, markers are drawn on one canvas instead of one DOM element each
+const CANVAS_MARKER_THRESHOLD = 200;
+const canvasRenderer = L.canvas({ padding: 0.5 });
+let useCanvasMarkers = false;
+
+// Only fit the map to the aircraft once, so refreshes don't fight the user's pan/zoom
+let hasFittedBounds = false;
+
+// The recent flights list has one source: the database when it answers, OpenSky's
+// flight history otherwise - rendering both into it would replace every row twice per refresh
+let databaseFlightsAvailable = false;
+
+// Fetch live + history data and update the map and sidebar
+async function fetchAircraftData() {
     try {
-        // Show loading state
+        // Show loading state (first load only - later refreshes update rows in place)
         const aircraftList = document.getElementById('aircraftList');
-        if (aircraftList) {
+        if (aircraftList && aircraftMarkers.size === 0 && !aircraftList.querySelector('[data-key]')) {
             aircraftList.innerHTML = '<div class="loading">Loading aircraft data...</div>';
         }
 
         // Fetch comprehensive data (includes both live and history)
         let response = await fetch('/api/comprehensive/all');
         let comprehensiveData = await response.json();
-        
-        // Clear existing markers
-        aircraftMarkers.forEach(marker => map.removeLayer(marker));
-        aircraftMarkers = [];
+        if (comprehensiveData.next_poll_seconds) {
+            serverPollSeconds = comprehensiveData.next_poll_seconds;
+        }
         
         // Extract current aircraft for display
         let currentAircraft = [];
@@ -65,38 +80,28 @@ async function loadData() {
             flights_24h: total24hFlights
         });
         
-        // Process aircraft data for map
+        // Move, add and remove markers to match the current aircraft
+        reconcileMarkers(currentAircraft);
+        
         if (currentAircraft.length > 0) {
-            currentAircraft.forEach(plane => {
-                if (plane.latitude && plane.longitude) {
-                    // Create a custom icon based on aircraft status
-                    const icon = createAircraftIcon(plane);
-                    
-                    const marker = L.marker([plane.latitude, plane.longitude], { icon: icon })
-                        .addTo(map)
-                        .bindPopup(createPopupContent(plane));
-                    
-                    aircraftMarkers.push(marker);
-                }
-            });
-            
             // Update aircraft list
             updateAircraftList(currentAircraft);
             
-            // Adjust map view to show all aircraft
-            if (aircraftMarkers.length > 0) {
-                const group = new L.featureGroup(aircraftMarkers);
+            // Adjust map view to show all aircraft (first time only)
+            if (!hasFittedBounds && aircraftMarkers.size > 0) {
+                const group = L.featureGroup([...aircraftMarkers.values()].map(entry => entry.marker));
                 map.fitBounds(group.getBounds().pad(0.1));
+                hasFittedBounds = true;
             }
         } else {
             // No aircraft found
-            if (aircraftList) {
-                aircraftList.innerHTML = '<div class="no-data">No aircraft currently transmitting data</div>';
-            }
+            renderKeyedList(aircraftList, [], null, null, 'No aircraft currently transmitting data');
         }
         
-        // Update flight history list
-        updateFlightHistoryList(comprehensiveData);
+        // Update flight history list (only when the database isn't providing it)
+        if (!databaseFlightsAvailable) {
+            updateFlightHistoryList(comprehensiveData);
+        }
         
         updateLastUpdate();
         
@@ -108,6 +113,155 @@ async function loadData() {
         }
     }
 }
+
+// Icon only needs rebuilding when something it shows changes
+function iconSignature(plane) {
+    return `${plane.on_ground}|${Math.sign(plane.vertical_rate || 0)}|${Math.round(plane.heading || 0)}`;
+}
+
+// Colour used for canvas markers (no emoji icons on canvas)
+function markerColor(plane) {
+    if (plane.on_ground) return '#7f8c8d';
+    if (plane.vertical_rate > 0) return '#27ae60';
+    if (plane.vertical_rate < 0) return '#e67e22';
+    return '#2563eb';
+}
+
+function createMarker(plane, latLng) {
+    if (useCanvasMarkers) {
+        return L.circleMarker(latLng, { renderer: canvasRenderer, radius: 5, weight: 1, fillOpacity: 0.9 });
+    }
+    return L.marker(latLng, { icon: createAircraftIcon(plane) });
+}
+
+// Bring the markers on the map in line with `aircraft`, touching only what changed
+function reconcileMarkers(aircraft) {
+    const wantCanvas = aircraft.length > CANVAS_MARKER_THRESHOLD;
+    if (wantCanvas !== useCanvasMarkers) {
+        // Switching renderers - rebuild every marker once
+        aircraftMarkers.forEach(entry => map.removeLayer(entry.marker));
+        aircraftMarkers.clear();
+        useCanvasMarkers = wantCanvas;
+    }
+
+    const seen = new Set();
+    aircraft.forEach(plane => {
+        if (plane.latitude === null || plane.latitude === undefined ||
+            plane.longitude === null || plane.longitude === undefined) {
+            return;
+        }
+        const key = plane.icao24.toLowerCase();
+        const latLng = [plane.latitude, plane.longitude];
+        seen.add(key);
+
+        let entry = aircraftMarkers.get(key);
+        if (!entry) {
+            entry = { marker: createMarker(plane, latLng), plane: plane, iconKey: null };
+            // Popup content is built when it opens, from the latest data for this aircraft
+            entry.marker.bindPopup(() => createPopupContent(entry.plane)).addTo(map);
+            aircraftMarkers.set(key, entry);
+        } else {
+            entry.marker.setLatLng(latLng);
+        }
+        entry.plane = plane;
+
+        const iconKey = iconSignature(plane);
+        if (iconKey !== entry.iconKey) {
+            if (useCanvasMarkers) {
+                entry.marker.setStyle({ color: markerColor(plane), fillColor: markerColor(plane) });
+            } else {
+                entry.marker.setIcon(createAircraftIcon(plane));
+            }
+            entry.iconKey = iconKey;
+        }
+        if (entry.marker.isPopupOpen()) {
+            entry.marker.setPopupContent(createPopupContent(plane));
+        }
+    });
+
+    // Aircraft that stopped transmitting
+    aircraftMarkers.forEach((entry, key) => {
+        if (!seen.has(key)) {
+            map.removeLayer(entry.marker);
+            aircraftMarkers.delete(key);
+        }
+    });
+}
+
+// Smoothed positions between polls come from /api/live/predicted (no OpenSky credits used)
+const PREDICTION_REFRESH_MS = 2000;
+
+// Move existing markers to their dead-reckoned positions; adding/removing aircraft is left to full refreshes
+async function refreshPredictedPositions() {
+    if (document.hidden || aircraftMarkers.size === 0) return;
+    try {
+        const response = await fetch('/api/live/predicted');
+        const data = await response.json();
+        (data.aircraft || []).forEach(plane => {
+            const entry = aircraftMarkers.get(plane.icao24.toLowerCase());
+            if (!entry || plane.latitude === null || plane.longitude === null) return;
+            entry.marker.setLatLng([plane.latitude, plane.longitude]);
+            entry.plane = { ...entry.plane, ...plane };
+            if (entry.marker.isPopupOpen()) {
+                entry.marker.setPopupContent(createPopupContent(entry.plane));
+            }
+        });
+    } catch (error) {
+        console.error('Error loading predicted positions:', error);
+    }
+}
+
+// HTML each rendered row was built from - kept here rather than in a DOM attribute
+const renderedRowHtml = new WeakMap();
+
+// Render `items` into `container` as rows keyed by keyFn(item). Rows whose HTML is
+// unchanged are left alone, changed rows are replaced, and rows are only moved when
+// the order changes. Shows `emptyMessage` when there are no items.
+function renderKeyedList(container, items, keyFn, htmlFn, emptyMessage) {
+    if (!container) return;
+
+    if (items.length === 0) {
+        container.innerHTML = `<div class="no-data">${emptyMessage}</div>`;
+        return;
+    }
+
+    // Drop placeholders (loading / no-data / error messages)
+    Array.from(container.children).forEach(child => {
+        if (!child.dataset.key) child.remove();
+    });
+
+    const existing = new Map();
+    Array.from(container.children).forEach(child => existing.set(child.dataset.key, child));
+
+    items.forEach((item, index) => {
+        const key = String(keyFn(item));
+        const html = htmlFn(item).trim();
+        let row = existing.get(key);
+        if (!row) {
+            const template = document.createElement('template');
+            template.innerHTML = html;
+            row = template.content.firstElementChild;
+            row.dataset.key = key;
+            renderedRowHtml.set(row, html);
+        } else if (renderedRowHtml.get(row) !== html) {
+            const template = document.createElement('template');
+            template.innerHTML = html;
+            const replacement = template.content.firstElementChild;
+            replacement.dataset.key = key;
+            renderedRowHtml.set(replacement, html);
+            row.replaceWith(replacement);
+            row = replacement;
+        }
+        existing.delete(key);
+        if (container.children[index] !== row) {
+            container.insertBefore(row, container.children[index] || null);
+        }
+    });
+
+    // Rows that are no longer present
+    existing.forEach(row => row.remove());
+}
+
 // Add these new functions to your script.js
 
 async function loadRecentFlights() {
@@ -115,8 +269,12 @@ async function loadRecentFlights() {
         const response = await fetch('/api/database/flights/recent?hours=24');
         const data = await response.json();
         
+        // No database - leave the list to OpenSky's flight history
+        databaseFlightsAvailable = response.ok && !data.error;
+        if (!databaseFlightsAvailable) return;
+        
         if (data.flights && data.flights.length > 0) {
-            updateFlightHistoryList(data.flights);
+            updateDatabaseFlightList(data.flights);
             updateFlights24hCount(data.count);
         } else {
             document.getElementById('flightHistoryList').innerHTML = 
@@ -125,15 +283,14 @@ async function loadRecentFlights() {
         }
     } catch (error) {
         console.error('Error loading recent flights:', error);
-        document.getElementById('flightHistoryList').innerHTML = 
-            '<div class="error">Error loading flight history</div>';
+        databaseFlightsAvailable = false;
     }
 }
 
-function updateFlightHistoryList(flights) {
+function updateDatabaseFlightList(flights) {
     const flightListElement = document.getElementById('flightHistoryList');
     
-    flightListElement.innerHTML = flights.map(flight => `
+    renderKeyedList(flightListElement, flights, flight => `db-${flight.id}`, flight => `
         <div class="flight-item">
             <div class="flight-header">
                 <span class="flight-callsign">${flight.callsign || 'N/A'}</span>
@@ -147,11 +304,11 @@ function updateFlightHistoryList(flights) {
                     ${formatDatabaseTimestamp(flight.departure_time)} - ${formatDatabaseTimestamp(flight.arrival_time)}
                 </div>
                 <div class="flight-aircraft">
-                    ${flight.registration} • Alt: ${flight.max_altitude ? Math.round(flight.max_altitude) + ' ft' : 'N/A'}
+                    ${flight.registration} • Alt: ${formatAltitude(flight.max_altitude)}
                 </div>
             </div>
         </div>
-    `).join('');
+    `, 'No flights in the last 24 hours');
 }
 
 function updateFlights24hCount(count) {
@@ -184,11 +341,6 @@ async function loadData() {
     await loadDatabaseStats(); // Load databse statistics
 }
 
-// Update your refresh button to load both
-document.getElementById('refreshBtn').addEventListener('click', function() {
-    loadData();  // Now loads both live data AND database flights
-});
-
 // Create custom aircraft icon
 function createAircraftIcon(plane) {
     let iconText = '✈️'; // Default icon
@@ -208,20 +360,22 @@ function createAircraftIcon(plane) {
     });
 }
 
+// Altitudes arrive in metres (OpenSky barometric altitude, recorded positions); show feet
+function formatAltitude(metres) {
+    return metres ? Math.round(metres * 3.28084) + ' ft' : 'N/A';
+}
+
 // Create popup content
 function createPopupContent(plane) {
     return `
         <div style="min-width: 200px;">
             <div style="font-weight: bold; margin-bottom: 8px;">${plane.callsign}</div>
             <div style="font-size: 0.9em;">
-<<<<<<< HEAD
-                <div><strong>Altitude:</strong> ${plane.altitude ? Math.round(plane.alitude) + ' ft' : 'N/A'}</div>
-=======
-                <div><strong>Altitude:</strong> ${plane.altitude ? Math.round(plane.altitude * 3.28084) + ' ft' : 'N/A'}</div>
->>>>>>> deeff6cfce083a78c69be62b3afcdca12b8fc927
+                <div><strong>Altitude:</strong> ${formatAltitude(plane.altitude)}</div>
                 <div><strong>Speed:</strong> ${plane.velocity ? Math.round(plane.velocity) + ' kt' : 'N/A'}</div>
                 <div><strong>Heading:</strong> ${plane.heading ? Math.round(plane.heading) + '°' : 'N/A'}</div>
                 <div><strong>Status:</strong> ${plane.on_ground ? 'On Ground' : 'In Flight'}</div>
+                ${plane.predicted ? `<div style="color: #7f8c8d;"><em>Predicted position (+${Math.round(plane.prediction_seconds)}s)</em></div>` : ''}
             </div>
         </div>
     `;
@@ -249,11 +403,11 @@ function updateAircraftList(aircraft) {
     const aircraftList = document.getElementById('aircraftList');
     if (!aircraftList) return;
 
-    aircraftList.innerHTML = aircraft.map(plane => `
-        <div class="aircraft-item" onclick="focusOnAircraft(${plane.longitude}, ${plane.latitude})">
+    renderKeyedList(aircraftList, aircraft, plane => plane.icao24.toLowerCase(), plane => `
+        <div class="aircraft-item" onclick="focusOnAircraft('${plane.icao24.toLowerCase()}')">
             <div class="aircraft-header">
                 <span class="callsign">${plane.callsign}</span>
-                <span class="altitude">${plane.altitude ? Math.round(plane.altitude) + ' ft' : 'N/A'}</span>
+                <span class="altitude">${formatAltitude(plane.altitude)}</span>
             </div>
             <div class="aircraft-details">
                 <div class="detail">
@@ -270,19 +424,15 @@ function updateAircraftList(aircraft) {
                 </div>
             </div>
         </div>
-    `).join('');
+    `, 'No aircraft currently transmitting data');
 }
 
 // Focus on specific aircraft
-function focusOnAircraft(lon, lat) {
-    map.setView([lat, lon], 13);
-    // Find and open the marker popup
-    aircraftMarkers.forEach(marker => {
-        const markerLatLng = marker.getLatLng();
-        if (markerLatLng.lat === lat && markerLatLng.lng === lon) {
-            marker.openPopup();
-        }
-    });
+function focusOnAircraft(icao24) {
+    const entry = aircraftMarkers.get(icao24);
+    if (!entry) return;
+    map.setView(entry.marker.getLatLng(), 13);
+    entry.marker.openPopup();
 }
 
 // Update last update time
@@ -296,20 +446,40 @@ function updateLastUpdate() {
 updateLastUpdate();
 
 // Auto-refresh functions
+// Refreshing faster than the server's poll plan only returns cached data, so follow its hint
+function scheduleAutoRefresh() {
+    autoRefreshInterval = setTimeout(async () => {
+        await loadData();
+        if (autoRefreshInterval) {
+            scheduleAutoRefresh();
+        }
+    }, Math.max(10, serverPollSeconds) * 1000);
+}
+
 function startAutoRefresh() {
-    stopAutoRefresh();
-    autoRefreshInterval = setInterval(loadData, 30000); // 30 seconds
-    alert('Auto-refresh started (every 30 seconds)');
+    stopAutoRefresh(false);
+    scheduleAutoRefresh();
+    alert(`Auto-refresh started (following the server poll plan, currently every ${serverPollSeconds} seconds)`);
 }
 
-function stopAutoRefresh() {
+function stopAutoRefresh(notify = true) {
     if (autoRefreshInterval) {
-        clearInterval(autoRefreshInterval);
+        clearTimeout(autoRefreshInterval);
         autoRefreshInterval = null;
-        alert('Auto-refresh stopped');
+        if (notify) {
+            alert('Auto-refresh stopped');
+        }
     }
 }
 
+// Background refresh every 2 minutes, or slower when the server plan says so (e.g. overnight)
+function scheduleBackgroundRefresh() {
+    setTimeout(async () => {
+        await loadData();
+        scheduleBackgroundRefresh();
+    }, Math.max(120, serverPollSeconds) * 1000);
+}
+
 // Manual refresh
 function refreshData() {
     loadData();
@@ -355,13 +525,9 @@ function updateFlightHistoryList(comprehensiveData) {
     // Sort flights by first seen time (most recent first)
     uniqueFlights.sort((a, b) => (b.firstSeen || 0) - (a.firstSeen || 0));
     
-    if (uniqueFlights.length === 0) {
-        flightHistoryList.innerHTML = '<div class="no-data">No flights in the past 24 hours</div>';
-        return;
-    }
-    
     // Display flights
-    flightHistoryList.innerHTML = uniqueFlights.map(flight => {
+    const flightKey = flight => `${flight.icao24}-${flight.callsign}-${flight.firstSeen}-${flight.lastSeen}`;
+    renderKeyedList(flightHistoryList, uniqueFlights, flightKey, flight => {
         const callsign = (flight.callsign || 'N/A').trim();
         const departure = flight.estDepartureAirport || 'Unknown';
         const arrival = flight.estArrivalAirport || 'Unknown';
@@ -412,7 +578,63 @@ function updateFlightHistoryList(comprehensiveData) {
                 </div>
             </div>
         `;
-    }).join('');
+    }, 'No flights in the past 24 hours');
+}
+
+// Flight replay (Server-Sent Events from /api/replay/<registration>)
+let replaySource = null;
+let replayLayer = null;
+
+function startReplay() {
+    stopReplay();
+    const registration = document.getElementById('replayRegistration').value;
+    const startValue = document.getElementById('replayStart').value;
+    const endValue = document.getElementById('replayEnd').value;
+    const speed = document.getElementById('replaySpeed').value;
+    const status = document.getElementById('replayStatus');
+
+    // Default to the last two hours when no range is picked
+    const end = endValue ? Math.floor(new Date(endValue).getTime() / 1000) : Math.floor(Date.now() / 1000);
+    const start = startValue ? Math.floor(new Date(startValue).getTime() / 1000) : end - 7200;
+
+    const track = L.polyline([], { color: '#e74c3c', weight: 3 });
+    const marker = L.circleMarker([0, 0], { radius: 6, color: '#e74c3c', fillOpacity: 1 });
+    replayLayer = L.layerGroup([track]).addTo(map);
+    let positions = 0;
+
+    replaySource = new EventSource(`/api/replay/${registration}?start=${start}&end=${end}&speed=${speed}`);
+    replaySource.addEventListener('start', () => {
+        status.textContent = `Replaying ${registration} at ${speed}x...`;
+    });
+    replaySource.addEventListener('position', event => {
+        const position = JSON.parse(event.data);
+        if (position.latitude === null || position.longitude === null) return;
+        const latLng = [position.latitude, position.longitude];
+        track.addLatLng(latLng);
+        marker.setLatLng(latLng);
+        if (positions === 0) {
+            marker.addTo(replayLayer);
+            map.setView(latLng, 12);
+        }
+        positions++;
+        status.textContent = `${registration} ${new Date(position.timestamp * 1000).toLocaleTimeString()} • Alt: ${formatAltitude(position.altitude)}`;
+    });
+    replaySource.addEventListener('end', () => {
+        status.textContent = positions ? `Replay finished (${positions} positions)` : 'No recorded positions in that range';
+        replaySource.close();
+        replaySource = null;
+    });
+}
+
+function stopReplay() {
+    if (replaySource) {
+        replaySource.close();
+        replaySource = null;
+    }
+    if (replayLayer) {
+        map.removeLayer(replayLayer);
+        replayLayer = null;
+    }
 }
 
 // Initialize when page loads
@@ -431,10 +653,22 @@ document.addEventListener('DOMContentLoaded', function() {
     if (stopRefreshBtn) {
         stopRefreshBtn.addEventListener('click', stopAutoRefresh);
     }
+
+    const replayBtn = document.getElementById('replayBtn');
+    const stopReplayBtn = document.getElementById('stopReplayBtn');
+    if (replayBtn) {
+        replayBtn.addEventListener('click', startReplay);
+    }
+    if (stopReplayBtn) {
+        stopReplayBtn.addEventListener('click', stopReplay);
+    }
     
     // Load initial data
     loadData();
     
-    // Set up auto-refresh every 2 minutes
-    setInterval(loadData, 120000);
+    // Set up background refresh (every 2 minutes or per the server poll plan)
+    scheduleBackgroundRefresh();
+
+    // Glide markers along their tracks between refreshes
+    setInterval(refreshPredictedPositions, PREDICTION_REFRESH_MS);
 });
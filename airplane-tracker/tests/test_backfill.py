@@ -0,0 +1,121 @@
+# Backfill checkpoints: a rerun resumes with the chunks an earlier run didn't finish
+import sqlite3
+import time
+
+import pytest
+
+import backfill
+import database
+from fetch_data import AIRCRAFT_MAP
+
+REGISTRATION = 'N31401'
+ICAO24 = AIRCRAFT_MAP[REGISTRATION]
+HOUR = 3600
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('AIRCRAFT_DB_PATH', str(tmp_path / 'test.db'))
+    monkeypatch.setattr(database, '_db', None)
+    return database.get_db()
+
+
+@pytest.fixture
+def opensky(tmp_path, monkeypatch):
+    """
+    Fake fetch_flights_between: one flight per chunk, logged to a file because the chunks run
+    in forked worker processes. Chunks starting at a time listed in `failing` fail.
+    """
+    calls = tmp_path / 'calls.log'
+    failing = tmp_path / 'failing'
+    failing.write_text('')
+
+    def fetch_flights_between(icao24, chunk_start, chunk_end):
+        with open(calls, 'a') as log:
+            log.write(f"{chunk_start} {chunk_end}\n")
+        if str(chunk_start) in failing.read_text().split():
+            return None
+        return [{'callsign': 'FFC1  ', 'firstSeen': chunk_start + 600, 'lastSeen': chunk_start + 1200}]
+
+    def fetched():
+        fetched_chunks = [tuple(map(int, line.split())) for line in calls.read_text().splitlines()]
+        calls.write_text('')
+        return sorted(fetched_chunks)
+
+    def fail(*chunk_starts):
+        failing.write_text(' '.join(map(str, chunk_starts)))
+
+    calls.write_text('')
+    monkeypatch.setattr(backfill, 'fetch_flights_between', fetch_flights_between)
+    monkeypatch.setattr(backfill.breakers['flights'], 'allow_request', lambda: True)
+    return fetched, fail
+
+
+def run(start, end, **options):
+    options.setdefault('workers', 2)
+    options.setdefault('rate_per_minute', 0)
+    return backfill.backfill(start, end, [REGISTRATION], chunk_hours=2, **options)
+
+
+def stored_flights(db):
+    conn = sqlite3.connect(db.db_path)
+    try:
+        return conn.execute('SELECT first_seen, callsign FROM flight_sessions ORDER BY first_seen').fetchall()
+    finally:
+        conn.close()
+
+
+def test_split_chunks_aligns_to_start():
+    assert backfill.split_chunks(0, 5 * HOUR, 2 * HOUR) == [(0, 2 * HOUR), (2 * HOUR, 4 * HOUR), (4 * HOUR, 5 * HOUR)]
+
+
+def test_rerun_only_fetches_failed_chunks(db, opensky):
+    fetched, fail = opensky
+    start = int(time.time()) // HOUR * HOUR - 10 * HOUR
+    fail(start + 2 * HOUR)
+    summary = run(start, start + 6 * HOUR)
+    assert (summary['done'], summary['failed'], summary['already_done']) == (2, 1, 0)
+    assert len(fetched()) == 3
+
+    fail()
+    summary = run(start, start + 6 * HOUR)
+    assert (summary['done'], summary['failed'], summary['already_done']) == (1, 0, 2)
+    assert fetched() == [(start + 2 * HOUR, start + 4 * HOUR)]
+    assert stored_flights(db) == [(start + offset * HOUR + 600, 'FFC1') for offset in (0, 2, 4)]
+
+
+def test_later_end_tops_up_the_last_chunk(db, opensky):
+    fetched, _ = opensky
+    start = int(time.time()) // HOUR * HOUR - 10 * HOUR
+    run(start, start + 3 * HOUR)
+    assert fetched() == [(start, start + 2 * HOUR), (start + 2 * HOUR, start + 3 * HOUR)]
+
+    # The cut-short chunk is fetched again in full, the finished one is skipped
+    summary = run(start, start + 6 * HOUR)
+    assert summary['already_done'] == 1
+    assert fetched() == [(start + 2 * HOUR, start + 4 * HOUR), (start + 4 * HOUR, start + 6 * HOUR)]
+    # Refetching a chunk upserts its flights instead of duplicating them
+    assert len(stored_flights(db)) == 3
+
+
+def test_credit_budget_leaves_chunks_for_the_next_run(db, opensky):
+    fetched, _ = opensky
+    start = int(time.time()) // HOUR * HOUR - 10 * HOUR
+    cost = backfill.CREDIT_COST['flights']
+    summary = run(start, start + 8 * HOUR, credits=2 * cost)
+    assert (summary['done'], summary['not_dispatched'], summary['credits_used']) == (2, 2, 2 * cost)
+    assert fetched() == [(start, start + 2 * HOUR), (start + 2 * HOUR, start + 4 * HOUR)]
+
+    summary = run(start, start + 8 * HOUR)
+    assert (summary['done'], summary['already_done'], summary['not_dispatched']) == (2, 2, 0)
+    assert fetched() == [(start + 4 * HOUR, start + 6 * HOUR), (start + 6 * HOUR, start + 8 * HOUR)]
+
+
+def test_restart_ignores_checkpoints(db, opensky):
+    fetched, _ = opensky
+    start = int(time.time()) // HOUR * HOUR - 10 * HOUR
+    run(start, start + 4 * HOUR)
+    fetched()
+    summary = run(start, start + 4 * HOUR, restart=True)
+    assert (summary['done'], summary['already_done']) == (2, 0)
+    assert len(fetched()) == 2
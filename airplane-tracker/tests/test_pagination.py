@@ -0,0 +1,66 @@
+# Keyset pagination cursors and the paged flight queries
+import time
+
+import pytest
+
+from database import AircraftDatabase, decode_cursor, encode_cursor
+from fetch_data import AIRCRAFT_MAP
+
+
+@pytest.fixture
+def db(tmp_path):
+    return AircraftDatabase(str(tmp_path / 'test.db'))
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(1759363200, 42)) == (1759363200, 42)
+    assert decode_cursor(encode_cursor(1759363200.5, 7)) == (1759363200.5, 7)
+
+
+def test_cursor_for_missing_departure_time():
+    # Sorts as 0, like COALESCE(departure_time, 0) in the query
+    assert decode_cursor(encode_cursor(None, 3)) == (0, 3)
+
+
+def test_decode_cursor_passes_none_and_rejects_garbage():
+    assert decode_cursor(None) is None
+    assert decode_cursor('') is None
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor('abc', 1))
+
+
+def test_pages_cover_every_flight_including_missing_departure_times(db):
+    now = int(time.time())
+    icao24 = next(iter(AIRCRAFT_MAP.values()))
+    departures = [now - 600, None, now - 300, None, now - 900, None, now - 300]
+    db.save_flight_sessions_bulk([
+        {'icao24': icao24, 'departure_time': departure, 'first_seen': now - 1000 + i, 'last_seen': now - i}
+        for i, departure in enumerate(departures)
+    ])
+
+    seen, cursor = [], None
+    while True:
+        flights, cursor = db.get_recent_flights_page(hours=1, limit=2, cursor=cursor)
+        seen.extend(flights)
+        if cursor is None:
+            break
+
+    assert len(seen) == len(departures)
+    assert len({flight['id'] for flight in seen}) == len(departures)
+    keys = [(flight['departure_time'] or 0, flight['id']) for flight in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_streamed_flights_start_after_cursor(db):
+    now = int(time.time())
+    icao24 = next(iter(AIRCRAFT_MAP.values()))
+    db.save_flight_sessions_bulk([
+        {'icao24': icao24, 'departure_time': None if i % 2 else now - i, 'first_seen': now - 100 + i, 'last_seen': now}
+        for i in range(6)
+    ])
+    first_page, cursor = db.get_recent_flights_page(hours=1, limit=3)
+    rest = list(db.iter_flights(hours=1, after=decode_cursor(cursor)))
+    assert {f['id'] for f in first_page} | {f['id'] for f in rest} == {f['id'] for f in db.iter_flights(hours=1)}
+    assert not {f['id'] for f in first_page} & {f['id'] for f in rest}
@@ -0,0 +1,112 @@
+# Track block codec and the chunked block storage (TRACK_STORAGE=blocks)
+import pytest
+
+import database
+import tracks
+from database import AircraftDatabase
+from fetch_data import AIRCRAFT_MAP
+
+
+def point(timestamp, callsign='FFC1', **fields):
+    values = {'latitude': 41.78, 'longitude': -87.75, 'altitude': 610, 'velocity': 55.2,
+              'heading': 271.4, 'on_ground': False, 'callsign': callsign}
+    values.update(fields)
+    return dict(values, timestamp=timestamp)
+
+
+def test_round_trip():
+    points = [point(1759363200), point(1759363210, latitude=41.79, altitude=640), point(1759363225, on_ground=True)]
+    assert tracks.decode_points(tracks.encode_points(points)) == points
+
+
+def test_round_trip_negative_deltas_and_missing_values():
+    points = [
+        point(1759363200, latitude=-33.94601, longitude=151.17722, altitude=-12, heading=359.9),
+        point(1759363201, latitude=None, longitude=None, altitude=None, velocity=None, heading=None, on_ground=None),
+        point(1759363202, latitude=-33.95, longitude=151.1, altitude=0, velocity=0, heading=0.1),
+    ]
+    assert tracks.decode_points(tracks.encode_points(points)) == points
+
+
+def test_missing_callsign_stays_distinct_from_empty():
+    points = [point(1759363200, callsign=None), point(1759363210, callsign=''), point(1759363220, callsign='FFC1'),
+              point(1759363230, callsign=None)]
+    decoded = tracks.decode_points(tracks.encode_points(points))
+    assert [p['callsign'] for p in decoded] == [None, '', 'FFC1', None]
+
+
+def test_empty_block():
+    assert tracks.decode_points(tracks.encode_points([])) == []
+
+
+def test_decodes_version_1_blocks():
+    # Written by the version 1 encoder, which stored a missing callsign as ''
+    blob = bytes.fromhex('789c6364626271737336645828af7970fa577686f9132e09306ce46478cacf305186819195811100a37f08ba')
+    first, second = tracks.decode_points(blob)
+    assert first == {'timestamp': 1000, 'latitude': 41.5, 'longitude': -87.25, 'altitude': 300,
+                     'velocity': 50.5, 'heading': 90, 'on_ground': False, 'callsign': 'FFC1'}
+    assert second['callsign'] == '' and second['latitude'] is None and second['on_ground'] is True
+
+
+def test_rejects_unknown_versions():
+    blob = bytearray(tracks.zlib.decompress(tracks.encode_points([point(1759363200)])))
+    blob[0] = 99
+    with pytest.raises(ValueError):
+        tracks.decode_points(tracks.zlib.compress(bytes(blob)))
+
+
+@pytest.fixture
+def blocks_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'TRACK_STORAGE', 'blocks')
+    return AircraftDatabase(str(tmp_path / 'test.db'))
+
+
+def status(timestamp, **fields):
+    return dict(point(timestamp, **fields), icao24=next(iter(AIRCRAFT_MAP.values())), last_contact=timestamp)
+
+
+def stored_blocks(db):
+    conn = database.sqlite3.connect(db.db_path)
+    try:
+        return conn.execute('SELECT block_start, block_end, point_count FROM track_blocks ORDER BY block_start').fetchall()
+    finally:
+        conn.close()
+
+
+def test_each_commit_adds_a_chunk_and_finished_hours_are_merged(blocks_db):
+    hour = tracks.block_start(1759363200)
+    registration = next(iter(AIRCRAFT_MAP))
+    for offset in (10, 20, 30):
+        blocks_db.save_aircraft_status([status(hour + offset, latitude=41.7 + offset / 1000)])
+    assert stored_blocks(blocks_db) == [(hour + 10, hour + 10, 1), (hour + 20, hour + 20, 1), (hour + 30, hour + 30, 1)]
+
+    # The first sample of the next hour closes the previous one
+    blocks_db.save_aircraft_status([status(hour + 3605, latitude=41.8)])
+    assert stored_blocks(blocks_db) == [(hour + 10, hour + 30, 3), (hour + 3605, hour + 3605, 1)]
+
+    history = list(blocks_db.iter_status_history(registration, hour, hour + 7200))
+    assert [p['timestamp'] for p in history] == [hour + 10, hour + 20, hour + 30, hour + 3605]
+    assert [p['latitude'] for p in history] == [41.71, 41.72, 41.73, 41.8]
+
+
+def test_batch_spanning_an_hour_merges_the_earlier_hour(blocks_db):
+    hour = tracks.block_start(1759363200)
+    blocks_db.save_aircraft_status([status(hour + 3500, latitude=41.70)])
+    # The writer thread can hand over several polls of one aircraft in one commit
+    blocks_db.save_aircraft_status([status(hour + 3590, latitude=41.71)])
+    blocks_db.save_aircraft_status([status(hour + 3595, latitude=41.72), status(hour + 3610, latitude=41.73)])
+    assert stored_blocks(blocks_db) == [(hour + 3500, hour + 3595, 3), (hour + 3610, hour + 3610, 1)]
+
+
+def test_restart_resumes_after_the_latest_chunk(blocks_db):
+    hour = tracks.block_start(1759363200)
+    blocks_db.save_aircraft_status([status(hour + 10, callsign=None)])
+    blocks_db.save_aircraft_status([status(hour + 20, latitude=41.79, callsign=None)])
+
+    reopened = AircraftDatabase(blocks_db.db_path)
+    # Repeating the last stored sample is recognised as a duplicate after the restart
+    assert reopened.save_aircraft_status([status(hour + 20, latitude=41.79, callsign=None)]) == 0
+    assert reopened.save_aircraft_status([status(hour + 3610, latitude=41.8, callsign=None)]) == 1
+    assert stored_blocks(reopened)[0] == (hour + 10, hour + 20, 2)
+    history = list(reopened.iter_status_history(next(iter(AIRCRAFT_MAP)), hour, hour + 7200))
+    assert [p['callsign'] for p in history] == [None, None, None]
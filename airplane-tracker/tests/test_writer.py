@@ -0,0 +1,148 @@
+# Write-behind StatusWriter: full-queue policies, flush and close
+import threading
+import time
+
+import pytest
+
+from writer import BLOCK, DROP_NEWEST, DROP_OLDEST, ROWS_DROPPED, StatusWriter
+
+
+class FakeDatabase:
+    """Records committed batches; while `gate` is cleared the writer thread stalls inside a commit"""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.gate = threading.Event()
+        self.gate.set()
+        self.writing = threading.Event()
+
+    def save_aircraft_status(self, batch):
+        self.writing.set()
+        self.gate.wait()
+        if self.fail:
+            raise OSError('disk full')
+        self.batches.append(list(batch))
+
+    @property
+    def rows(self):
+        return [row for batch in self.batches for row in batch]
+
+
+def make_writer(db, **options):
+    # Nothing is written until a batch fills up or flush()/close() asks for it
+    options.setdefault('batch_size', 100)
+    options.setdefault('flush_interval', 60)
+    return StatusWriter(db, **options)
+
+
+def test_flush_commits_everything_accepted():
+    db = FakeDatabase()
+    writer = make_writer(db, max_queued=10, policy=DROP_OLDEST)
+    assert writer.submit([1, 2, 3]) == 3
+    assert writer.flush(timeout=5)
+    assert db.rows == [1, 2, 3]
+    assert writer.pending() == 0
+    writer.close()
+
+
+def test_full_batches_are_written_without_a_flush():
+    db = FakeDatabase()
+    writer = make_writer(db, max_queued=10, batch_size=2)
+    writer.submit([1, 2, 3, 4])
+    deadline = time.monotonic() + 5
+    while len(db.rows) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert db.batches == [[1, 2], [3, 4]]
+    writer.close()
+
+
+def test_drop_oldest_keeps_the_newest_rows():
+    db = FakeDatabase()
+    writer = make_writer(db, max_queued=3, policy=DROP_OLDEST)
+    dropped = ROWS_DROPPED.get(reason='drop_oldest')
+    assert writer.submit([1, 2, 3, 4, 5]) == 5
+    assert ROWS_DROPPED.get(reason='drop_oldest') == dropped + 2
+    assert writer.flush(timeout=5)
+    assert db.rows == [3, 4, 5]
+    writer.close()
+
+
+def test_drop_newest_rejects_rows_once_full():
+    db = FakeDatabase()
+    writer = make_writer(db, max_queued=3, policy=DROP_NEWEST)
+    dropped = ROWS_DROPPED.get(reason='queue_full')
+    assert writer.submit([1, 2, 3, 4, 5]) == 3
+    assert ROWS_DROPPED.get(reason='queue_full') == dropped + 2
+    assert writer.flush(timeout=5)
+    assert db.rows == [1, 2, 3]
+    writer.close()
+
+
+def test_block_waits_for_the_writer_to_make_room():
+    db = FakeDatabase()
+    writer = make_writer(db, max_queued=2, batch_size=2, policy=BLOCK, block_timeout=5)
+    db.gate.clear()
+    writer.submit([1, 2])
+    assert db.writing.wait(5)  # The writer has taken [1, 2] and is stuck committing it
+    writer.submit([3, 4])      # Fills the queue again
+
+    threading.Timer(0.2, db.gate.set).start()
+    started = time.monotonic()
+    assert writer.submit([5]) == 1  # Blocks until the writer takes [3, 4]
+    assert time.monotonic() - started >= 0.1
+    assert writer.flush(timeout=5)
+    assert db.rows == [1, 2, 3, 4, 5]
+    writer.close()
+
+
+def test_block_gives_up_after_block_timeout():
+    db = FakeDatabase()
+    writer = make_writer(db, max_queued=2, batch_size=2, policy=BLOCK, block_timeout=0.1)
+    db.gate.clear()
+    writer.submit([1, 2])
+    assert db.writing.wait(5)
+    writer.submit([3, 4])
+    dropped = ROWS_DROPPED.get(reason='queue_full')
+    assert writer.submit([5]) == 0
+    assert ROWS_DROPPED.get(reason='queue_full') == dropped + 1
+    db.gate.set()
+    writer.close()
+    assert db.rows == [1, 2, 3, 4]
+
+
+def test_flush_times_out_while_the_database_is_stuck():
+    db = FakeDatabase()
+    writer = make_writer(db)
+    db.gate.clear()
+    writer.submit([1])
+    assert not writer.flush(timeout=0.1)
+    db.gate.set()
+    assert writer.flush(timeout=5)
+    writer.close()
+
+
+def test_close_drains_the_queue_and_refuses_new_rows():
+    db = FakeDatabase()
+    writer = make_writer(db)
+    writer.submit([1, 2, 3])
+    writer.close()
+    assert db.rows == [1, 2, 3]
+    dropped = ROWS_DROPPED.get(reason='closed')
+    assert writer.submit([4]) == 0
+    assert ROWS_DROPPED.get(reason='closed') == dropped + 1
+
+
+def test_write_errors_are_counted_and_settle_flush():
+    db = FakeDatabase(fail=True)
+    writer = make_writer(db)
+    dropped = ROWS_DROPPED.get(reason='write_error')
+    writer.submit([1, 2])
+    assert writer.flush(timeout=5)
+    assert ROWS_DROPPED.get(reason='write_error') == dropped + 2
+    writer.close()
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        StatusWriter(FakeDatabase(), policy='drop_everything')
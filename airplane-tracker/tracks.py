@@ -0,0 +1,128 @@
+# tracks.py
+# Compact encoding for blocks of one aircraft's track (used when TRACK_STORAGE=blocks)
+# Points are stored column by column as fixed-point integers; each column is delta-encoded
+# against its previous value and written as zigzag varints, then the whole block is
+# zlib-compressed. A parked or cruising aircraft changes little between samples, so most
+# deltas fit in a single byte before compression even starts.
+import zlib
+
+# Version 2 keeps a missing callsign (None) apart from an empty one; version 1 stored both as ''
+FORMAT_VERSION = 2
+
+# Track time covered by one block (seconds)
+BLOCK_SECONDS = 3600
+
+# (field, scale) - values are stored as round(value * scale); None is stored as "missing"
+COLUMNS = (
+    ('timestamp', 1),
+    ('latitude', 100000),    # ~1.1m
+    ('longitude', 100000),
+    ('altitude', 1),         # metres
+    ('velocity', 10),        # 0.1 m/s
+    ('heading', 10),         # 0.1 degree
+    ('on_ground', 1),
+)
+
+
+def block_start(timestamp):
+    """Start of the block a timestamp belongs to"""
+    return int(timestamp) // BLOCK_SECONDS * BLOCK_SECONDS
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return (value << 1) if value >= 0 else ((-value << 1) - 1)
+
+
+def _unzigzag(value):
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+
+def encode_points(points):
+    """Encode a list of point dicts (see COLUMNS, plus 'callsign') into a compressed block"""
+    out = bytearray()
+    _write_varint(out, FORMAT_VERSION)
+    _write_varint(out, len(points))
+
+    # Callsigns rarely change within a block - store each distinct one once and index it
+    callsigns = []
+    for point in points:
+        callsign = point.get('callsign')
+        if callsign is not None and callsign not in callsigns:
+            callsigns.append(callsign)
+    _write_varint(out, len(callsigns))
+    for callsign in callsigns:
+        encoded = callsign.encode('utf-8')
+        _write_varint(out, len(encoded))
+        out.extend(encoded)
+
+    for field, scale in COLUMNS:
+        previous = 0
+        for point in points:
+            value = point.get(field)
+            if value is None:
+                out.append(0)  # Missing
+                continue
+            scaled = int(round(float(value) * scale))
+            # Token 0 is reserved for missing, so present values are shifted up by one
+            _write_varint(out, _zigzag(scaled - previous) * 2 + 1)
+            previous = scaled
+    for point in points:
+        # Index 0 is reserved for a missing callsign, so stored ones are shifted up by one
+        callsign = point.get('callsign')
+        _write_varint(out, 0 if callsign is None else callsigns.index(callsign) + 1)
+
+    return zlib.compress(bytes(out), 6)
+
+
+def decode_points(blob):
+    """Inverse of encode_points - returns point dicts in stored order"""
+    data = zlib.decompress(blob)
+    version, pos = _read_varint(data, 0)
+    if version not in (1, FORMAT_VERSION):
+        raise ValueError(f"Unsupported track block version {version}")
+    count, pos = _read_varint(data, pos)
+
+    callsign_count, pos = _read_varint(data, pos)
+    callsigns = []
+    for _ in range(callsign_count):
+        length, pos = _read_varint(data, pos)
+        callsigns.append(data[pos:pos + length].decode('utf-8'))
+        pos += length
+
+    points = [{} for _ in range(count)]
+    for field, scale in COLUMNS:
+        previous = 0
+        for point in points:
+            token, pos = _read_varint(data, pos)
+            if token == 0:
+                point[field] = None
+                continue
+            previous += _unzigzag((token - 1) >> 1)
+            point[field] = previous if scale == 1 else previous / scale
+    for point in points:
+        index, pos = _read_varint(data, pos)
+        if version == 1:
+            point['callsign'] = callsigns[index]
+        else:
+            point['callsign'] = callsigns[index - 1] if index else None
+        if point['on_ground'] is not None:
+            point['on_ground'] = bool(point['on_ground'])
+    return points
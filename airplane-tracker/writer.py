@@ -0,0 +1,172 @@
+# writer.py
+# Write-behind buffer for status_history
+# Requests hand their aircraft rows to a bounded in-memory queue and return immediately;
+# a dedicated writer thread drains the queue and commits rows in groups (one transaction
+# per batch) once enough rows are waiting or the oldest has waited flush_interval seconds.
+# When the queue is full the policy decides what happens:
+#   block        - the caller waits (up to block_timeout) for room, then the rows are dropped
+#   drop_oldest  - the oldest queued rows make way for the new ones (default - newest data wins)
+#   drop_newest  - the new rows are discarded
+# Everything still queued is committed when the process exits.
+import atexit
+import os
+import threading
+import time
+import logging
+from collections import deque
+
+import metrics
+from database import get_db
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+# Defaults, overridable from the environment
+MAX_QUEUED_ROWS = int(os.environ.get('WRITE_QUEUE_SIZE', 5000))
+BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE', 200))
+FLUSH_INTERVAL = float(os.environ.get('WRITE_FLUSH_INTERVAL', 2.0))
+QUEUE_POLICY = os.environ.get('WRITE_QUEUE_POLICY', DROP_OLDEST)
+
+QUEUE_DEPTH = metrics.registry.gauge(
+    'ffc_db_write_queue_depth', 'Status rows waiting for the writer thread')
+ROWS_DROPPED = metrics.registry.counter(
+    'ffc_db_write_dropped_total', 'Status rows dropped instead of written', ('reason',))
+BATCH_ROWS = metrics.registry.histogram(
+    'ffc_db_write_batch_rows', 'Rows committed per group commit', buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000))
+
+
+class StatusWriter:
+    """Bounded queue of status rows drained by one writer thread"""
+
+    def __init__(self, db, max_queued=MAX_QUEUED_ROWS, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 policy=QUEUE_POLICY, block_timeout=1.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown write queue policy '{policy}' (expected one of {', '.join(POLICIES)})")
+        self.db = db
+        self.max_queued = max_queued
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._oldest_queued_at = None
+        self._accepted = 0   # Rows ever accepted into the queue
+        self._settled = 0    # Accepted rows written, failed or dropped - flush() waits for this to catch up
+        self._flush_requested = False
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name='ffc-db-writer')
+        self._thread.start()
+
+    def submit(self, rows):
+        """Queue rows for writing; returns how many were accepted"""
+        accepted = 0
+        with self._cond:
+            for row in rows:
+                if self._closing:
+                    ROWS_DROPPED.inc(reason='closed')
+                    continue
+                if len(self._queue) >= self.max_queued and not self._make_room():
+                    ROWS_DROPPED.inc(reason='queue_full')
+                    continue
+                if not self._queue:
+                    self._oldest_queued_at = time.monotonic()
+                self._queue.append(row)
+                self._accepted += 1
+                accepted += 1
+            QUEUE_DEPTH.set(len(self._queue))
+            self._cond.notify_all()
+        return accepted
+
+    def _make_room(self):
+        """Apply the full-queue policy (called with the lock held); True if there is now room"""
+        if self.policy == DROP_OLDEST:
+            self._queue.popleft()
+            self._settled += 1
+            ROWS_DROPPED.inc(reason='drop_oldest')
+            return True
+        if self.policy == BLOCK:
+            self._cond.notify_all()  # Make sure the writer knows there is a full batch to take
+            deadline = time.monotonic() + self.block_timeout
+            while len(self._queue) >= self.max_queued and not self._closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return len(self._queue) < self.max_queued
+        return False
+
+    def flush(self, timeout=None):
+        """Wait until every row accepted so far is committed (or failed); False on timeout"""
+        with self._cond:
+            target = self._accepted
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._settled >= target, timeout)
+
+    def close(self, timeout=10.0):
+        """Stop accepting rows, commit what is queued and stop the writer thread"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def _next_batch(self):
+        """Wait until a batch is due and take it off the queue; None once closed and drained"""
+        with self._cond:
+            while True:
+                if self._queue:
+                    due = (len(self._queue) >= self.batch_size or self._closing or self._flush_requested or
+                           time.monotonic() - self._oldest_queued_at >= self.flush_interval)
+                    if due:
+                        break
+                    self._cond.wait(self.flush_interval - (time.monotonic() - self._oldest_queued_at))
+                elif self._closing:
+                    return None
+                else:
+                    self._flush_requested = False
+                    self._cond.wait()
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._oldest_queued_at = time.monotonic() if self._queue else None
+            if not self._queue:
+                self._flush_requested = False
+            QUEUE_DEPTH.set(len(self._queue))
+            self._cond.notify_all()  # Wake callers blocked on a full queue
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self.db.save_aircraft_status(batch)
+                BATCH_ROWS.observe(len(batch))
+            except Exception as e:
+                # A failing disk must not take the writer thread down - count the rows and move on
+                ROWS_DROPPED.inc(len(batch), reason='write_error')
+                logging.error(f"Write-behind commit of {len(batch)} status rows failed: {e}")
+            with self._cond:
+                self._settled += len(batch)
+                self._cond.notify_all()
+
+
+# Shared writer - created on first use, flushed when the process exits
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_status_writer():
+    """Return the shared StatusWriter for the shared database"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = StatusWriter(get_db())
+                atexit.register(_writer.close)
+    return _writer